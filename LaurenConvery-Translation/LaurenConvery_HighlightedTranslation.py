@@ -1,57 +1,134 @@
+"""Translate the highlighted text cells of every sheet in a workbook.
+
+Usage:
+    python LaurenConvery_HighlightedTranslation.py China2.xlsx --output China2_Highlighted.xlsx
+    python LaurenConvery_HighlightedTranslation.py big.xlsx --mode stream
+    python LaurenConvery_HighlightedTranslation.py China2.xlsx --language zh-Hans ja ko
+
+Fills are scanned in one read-only pass over all sheets, the distinct highlighted strings are
+translated in concurrent batches, and the results are written back:
+
+- load (default): the workbook is loaded normally and only the translated cells change, so
+  merged cells, column widths, images and the like are kept. Memory grows with the workbook.
+- stream: the workbook is copied row by row into a write-only workbook, with each cell's
+  value, font, fill, border, alignment and number format. Memory stays flat on very large
+  sheets, but workbook-level layout (merged cells, column widths, images) is not copied.
+
+With several languages the strings are translated into all of them in shared requests and one
+workbook is written per language, <name>_translated_<language>.xlsx.
+"""
+import argparse
+import time
+
 import openpyxl
-import os
-import requests
-import uuid
-
-def translate_text(text, target_language='zh-Hans'):
-    """Translate text using Azure Translator."""
-    azure_translation_key = os.environ.get("AZURE_TRANSLATION_KEY")
-    azure_translation_endpoint = os.environ.get("AZURE_TRANSLATION_ENDPOINT")
-    azure_translation_location = os.environ.get("AZURE_TRANSLATION_LOCATION")
-
-    path = '/translate'
-    constructed_url = azure_translation_endpoint + path
-
-    headers = {
-        'Ocp-Apim-Subscription-Key': azure_translation_key,
-        'Ocp-Apim-Subscription-Region': azure_translation_location,
-        'Content-type': 'application/json',
-        'X-ClientTraceId': str(uuid.uuid4())
-    }
-
-    body = [{'text': text}]
-
-    params = {
-        'api-version': '3.0',
-        'from': 'en',
-        'to': [target_language]
-    }
-
-    response = requests.post(constructed_url, params=params, headers=headers, json=body)
-    response.raise_for_status()
-    return response.json()[0]['translations'][0]['text']
-
-def translate_highlighted_cells(file_path, target_language='zh-Hans', new_file_path=None):
-    # Load the workbook and sheet
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.read_only import EmptyCell
+
+from LaurenConvery_Translationapp import translate_unique_multi, translated_path
+
+NO_FILL = '00000000'  # The default colour index for a cell with no fill
+
+
+def is_highlighted(cell):
+    fill = getattr(cell, 'fill', None)
+    return fill is not None and fill.start_color.index != NO_FILL
+
+
+def scan_highlighted(file_path):
+    """Return {sheet title: [(row, column, text)]} for highlighted string cells, streaming the workbook."""
+    wb = openpyxl.load_workbook(file_path, read_only=True)
+    try:
+        highlighted = {}
+        for ws in wb.worksheets:
+            start = time.perf_counter()
+            cells = []
+            for row in ws.iter_rows():
+                for cell in row:
+                    if isinstance(cell.value, str) and cell.value.strip() and is_highlighted(cell):
+                        cells.append((cell.row, cell.column, cell.value))
+            highlighted[ws.title] = cells
+            print(f"Scanned '{ws.title}': {len(cells)} highlighted cells ({time.perf_counter() - start:.2f}s)")
+        return highlighted
+    finally:
+        wb.close()
+
+
+def write_back(file_path, new_file_path, highlighted, translations):
+    """Load the workbook normally and replace the highlighted cells."""
     wb = openpyxl.load_workbook(file_path)
-    ws = wb.active
-
-    # Iterate through all cells in the worksheet
-    for row in ws.iter_rows():
-        for cell in row:
-            # Check if the cell is highlighted
-            if cell.fill.start_color.index != '00000000':  # '00000000' is the default color index for no fill
-                if cell.value and isinstance(cell.value, str):
-                    # Translate the text in the cell
-                    translated_text = translate_text(cell.value, target_language)
-                    cell.value = translated_text
-
-    # Save the workbook to a new file
-    if new_file_path is None:
-        new_file_path = file_path.replace('.xlsx', '_translated.xlsx')
+    for title, cells in highlighted.items():
+        start = time.perf_counter()
+        ws = wb[title]
+        for row, column, text in cells:
+            ws.cell(row=row, column=column).value = translations.get(text, text)
+        print(f"Updated '{title}' ({time.perf_counter() - start:.2f}s)")
     wb.save(new_file_path)
 
-# Example usage
-file_path = 'China2.xlsx'
-new_file_path = 'China2_Highlighted.xlsx'
-translate_highlighted_cells(file_path, new_file_path=new_file_path)
\ No newline at end of file
+
+def stream_copy(file_path, new_file_path, translations):
+    """Copy the workbook row by row, translating highlighted cells, with flat memory use."""
+    source = openpyxl.load_workbook(file_path, read_only=True)
+    target = openpyxl.Workbook(write_only=True)
+    try:
+        for ws in source.worksheets:
+            start = time.perf_counter()
+            out = target.create_sheet(ws.title)
+            for row in ws.iter_rows():
+                out.append([_copy_cell(out, cell, translations) for cell in row])
+            print(f"Wrote '{ws.title}' ({time.perf_counter() - start:.2f}s)")
+        target.save(new_file_path)
+    finally:
+        source.close()
+
+
+def _copy_cell(ws, cell, translations):
+    if isinstance(cell, EmptyCell):  # A gap in a sparse row
+        return None
+    value = cell.value
+    if isinstance(value, str) and is_highlighted(cell):
+        value = translations.get(value, value)
+    copied = WriteOnlyCell(ws, value=value)
+    if cell.has_style:
+        copied.font = cell.font
+        copied.fill = cell.fill
+        copied.border = cell.border
+        copied.alignment = cell.alignment
+        copied.number_format = cell.number_format
+        copied.protection = cell.protection
+    return copied
+
+
+def translate_highlighted_cells(file_path, target_languages=('zh-Hans',), new_file_path=None, mode='load',
+                                source_language='en'):
+    highlighted = scan_highlighted(file_path)
+    translations = translate_unique_multi((text for cells in highlighted.values() for _, _, text in cells),
+                                          target_languages, source_language)
+
+    for language in target_languages:
+        # With several languages, --output names the files the same way: <output>_translated_<language>.xlsx
+        output_path = translated_path(new_file_path or file_path, language, target_languages)
+        if new_file_path and len(target_languages) == 1:
+            output_path = new_file_path
+        if mode == 'stream':
+            stream_copy(file_path, output_path, translations[language])
+        else:
+            write_back(file_path, output_path, highlighted, translations[language])
+        print(f"Saved {output_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate the highlighted text cells of an .xlsx workbook.")
+    parser.add_argument('file', help="Workbook to translate")
+    parser.add_argument('--output', help="Output path (default: <file>_translated.xlsx)")
+    parser.add_argument('--language', nargs='+', default=['zh-Hans'],
+                        help="Target language codes, translated together (default: zh-Hans)")
+    parser.add_argument('--source-language', default='en', help="Source language code (default: en)")
+    parser.add_argument('--mode', choices=['load', 'stream'], default='load',
+                        help="Write back into the loaded workbook, or stream a styled copy for very large files")
+    args = parser.parse_args(argv)
+    translate_highlighted_cells(args.file, list(dict.fromkeys(args.language)), args.output, args.mode,
+                                args.source_language)
+
+
+if __name__ == '__main__':
+    main()
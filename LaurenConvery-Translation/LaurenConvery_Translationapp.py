@@ -1,76 +1,144 @@
-import pandas as pd
-import os
-import requests
-import uuid
+"""Translate test-script columns of every Excel workbook in a folder.
+
+Usage:
+    python LaurenConvery_Translationapp.py ./Translation --language pt-BR
+    python LaurenConvery_Translationapp.py ./Translation --columns "Step" "Expected Result" --language fr
+    python LaurenConvery_Translationapp.py ./Translation --language fr de es
+
+The unique cell values of the selected columns across all workbooks are translated once, in
+packed batches, and mapped back column by column. Each workbook is saved as <name>_translated.xlsx,
+or as <name>_translated_<language>.xlsx per language when several are given; the languages share
+requests, so each string is sent once for all of them.
+"""
+import argparse
 import glob
+import os
+import re
+import sys
+import time
 
-# Assuming the Azure Translator setup and credentials are already configured in your environment
-def translate_text(text, target_language='pt-BR'):
-    """Translate text using Azure Translator."""
-    azure_translation_key = os.environ.get("AZURE_TRANSLATION_KEY")
-    azure_translation_endpoint = os.environ.get("AZURE_TRANSLATION_ENDPOINT")
-    azure_translation_location = os.environ.get("AZURE_TRANSLATION_LOCATION")
-
-    path = '/translate'
-    constructed_url = azure_translation_endpoint + path
-
-    headers = {
-        'Ocp-Apim-Subscription-Key': azure_translation_key,
-        'Ocp-Apim-Subscription-Region': azure_translation_location,
-        'Content-type': 'application/json',
-        'X-ClientTraceId': str(uuid.uuid4())
-    }
-
-    body = [{
-        'text': text
-    }]
-
-    params = {
-        'api-version': '3.0',
-        'from': 'en',
-        'to': [target_language]
-    }
-
-    response = requests.post(constructed_url, params=params, headers=headers, json=body)
-    response.raise_for_status()
-    return response.json()[0]['translations'][0]['text']
+import pandas as pd
 
-def translate_excel_columns(file_path, column_names, target_language='pt-BR', new_file_path=None):
+# Share the web app's Translator client and translation memory, which live in the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rate_limiter
+from translation_engine import MAX_ELEMENTS_PER_REQUEST, MAX_IN_FLIGHT, translate_blocks_multi
+from translation_memory import get_translation_memory
+from translator_client import get_translator_client
+
+# Column names for 'N', 'O', 'P' in the Excel files
+DEFAULT_COLUMNS = ['Test Script (Step-by-Step) - Step', 'Test Script (Step-by-Step) - Test Data',
+                   'Test Script (Step-by-Step) - Expected Result']
+# Strings per progress step; enough to keep every concurrent request full.
+PROGRESS_CHUNK = MAX_ELEMENTS_PER_REQUEST * MAX_IN_FLIGHT
+# Outputs written by earlier runs: <name>_translated.xlsx and <name>_translated_<language>.xlsx
+TRANSLATED_FILE_RE = re.compile(r'_translated(_[A-Za-z]{2,3}(-[A-Za-z0-9]+)*)?\.xlsx$')
+
+
+def translate_unique(texts, target_language='pt-BR', source_language='en'):
+    """Translate distinct strings in packed batches, printing progress. Returns {text: translation}."""
+    return translate_unique_multi(texts, [target_language], source_language)[target_language]
+
+
+def translate_unique_multi(texts, target_languages, source_language='en'):
+    """Translate distinct strings into every target language at once. Returns {language: {text: translation}}.
+
+    Runs at batch quota priority, so it only uses Translator quota the web app leaves spare.
+    """
+    texts = list(dict.fromkeys(texts))
+    client = get_translator_client()
+    memory = get_translation_memory()
+    translations = {language: {} for language in target_languages}
+    start = time.perf_counter()
+    for i in range(0, len(texts), PROGRESS_CHUNK):
+        with rate_limiter.priority(rate_limiter.BATCH):
+            chunk, _ = translate_blocks_multi(texts[i:i + PROGRESS_CHUNK], target_languages, client, source_language,
+                                              memory=memory)
+        for language, translated in chunk.items():
+            translations[language].update(translated)
+        print(f"Translated {min(i + PROGRESS_CHUNK, len(texts))}/{len(texts)} unique strings into "
+              f"{len(target_languages)} languages ({time.perf_counter() - start:.1f}s)")
+    return translations
+
+
+def translated_path(file_path, language, target_languages):
+    """<name>_translated.xlsx, or <name>_translated_<language>.xlsx when there are several languages."""
+    suffix = '_translated.xlsx' if len(target_languages) == 1 else f'_translated_{language}.xlsx'
+    return re.sub(r'\.xlsx$', suffix, file_path)
+
+
+def read_workbook(file_path, column_names):
     # Load the Excel file, ensuring the first row is used as the header
     df = pd.read_excel(file_path)
 
-    # Debugging: Print the columns to check if they are read correctly
-    print("Columns in DataFrame:", df.columns.tolist())
-
     # Check if the specified column names exist in the DataFrame
     missing_columns = [col for col in column_names if col not in df.columns]
     if missing_columns:
-        raise ValueError(f"Missing columns in the Excel file {file_path}: {missing_columns}")
+        raise ValueError(f"Missing columns in the Excel file {file_path}: {missing_columns}. "
+                         f"Columns found: {df.columns.tolist()}")
+    return df
 
-    # Create a new DataFrame with only the specified columns
-    df_selected = df[column_names].copy()
 
-    # Translate the selected columns for all rows
+def column_strings(df, column_names):
+    """The non-null string values of the given columns."""
     for column in column_names:
-        df_selected[column] = df_selected[column].apply(lambda x: translate_text(x, target_language) if pd.notna(x) else x)
+        yield from (value for value in df[column].dropna() if isinstance(value, str))
 
-    # Update the original DataFrame with the translated values
-    df.update(df_selected)
+
+def apply_translations(df, column_names, translations):
+    # One vectorised pass per column; numbers, dates and blanks are left as they are
+    for column in column_names:
+        df[column] = df[column].map(lambda value: translations.get(value, value) if isinstance(value, str) else value)
+    return df
+
+
+def translate_excel_columns(file_path, column_names, target_language='pt-BR', new_file_path=None):
+    df = read_workbook(file_path, column_names)
+    translations = translate_unique(column_strings(df, column_names), target_language)
+    apply_translations(df, column_names, translations)
 
     # Save the modified DataFrame to a new Excel file
     if new_file_path is None:
         new_file_path = file_path.replace('.xlsx', '_translated.xlsx')
     df.to_excel(new_file_path, index=False)
 
-def process_folder(folder_path):
-    # Column names for 'N', 'O', 'P' in the Excel files
-    column_names_to_translate = ['Test Script (Step-by-Step) - Step', 'Test Script (Step-by-Step) - Test Data', 'Test Script (Step-by-Step) - Expected Result']
-    excel_files = glob.glob(os.path.join(folder_path, '*.xlsx'))
-
-    for file_path in excel_files:
-        new_file_path = file_path.replace('.xlsx', '_translated.xlsx')
-        translate_excel_columns(file_path, column_names_to_translate, new_file_path=new_file_path)
 
-# Example usage
-folder_path = './Translation'
-process_folder(folder_path)
\ No newline at end of file
+def process_folder(folder_path, column_names=DEFAULT_COLUMNS, target_languages=('pt-BR',), source_language='en'):
+    # Earlier outputs sit next to their sources; don't translate them again.
+    excel_files = [path for path in sorted(glob.glob(os.path.join(folder_path, '*.xlsx')))
+                   if not TRANSLATED_FILE_RE.search(path)]
+    if not excel_files:
+        print(f"No .xlsx files found in {folder_path}")
+        return
+
+    frames = {}
+    for number, file_path in enumerate(excel_files, 1):
+        frames[file_path] = read_workbook(file_path, column_names)
+        print(f"[{number}/{len(excel_files)}] Read {file_path} ({len(frames[file_path])} rows)")
+
+    cells = [text for df in frames.values() for text in column_strings(df, column_names)]
+    unique = list(dict.fromkeys(cells))
+    print(f"{len(cells)} cells to translate, {len(unique)} unique")
+    translations = translate_unique_multi(unique, target_languages, source_language)
+
+    for number, (file_path, df) in enumerate(frames.items(), 1):
+        for language in target_languages:
+            new_file_path = translated_path(file_path, language, target_languages)
+            # apply_translations works in place, so every language starts from the source frame
+            apply_translations(df.copy(), column_names, translations[language]).to_excel(new_file_path, index=False)
+            print(f"[{number}/{len(frames)}] Wrote {new_file_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Translate test-script columns of every .xlsx file in a folder.")
+    parser.add_argument('folder', help="Folder containing the .xlsx files")
+    parser.add_argument('--columns', nargs='+', default=DEFAULT_COLUMNS, help="Column headers to translate")
+    parser.add_argument('--language', nargs='+', default=['pt-BR'],
+                        help="Target language codes, translated together (default: pt-BR)")
+    parser.add_argument('--source-language', default='en', help="Source language code (default: en)")
+    args = parser.parse_args(argv)
+    process_folder(args.folder, args.columns, list(dict.fromkeys(args.language)), args.source_language)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,26 @@
 import logging
 from logging.handlers import RotatingFileHandler
-from flask import Flask, request, jsonify, render_template, make_response, send_from_directory, abort, session
+from flask import Flask, Response, request, jsonify, render_template, send_file, send_from_directory, abort, stream_with_context
+import io
+import json
 import os
-import requests
-import pyodbc
-from datetime import datetime, timedelta
-import uuid
-import fitz  # PyMuPDF
+import itertools
+import shutil
 import tempfile
-import docx2txt
-from azure.storage.blob import BlobServiceClient
-import azure.cognitiveservices.speech as speechsdk
+
+import blob_storage
+import db
+import document_translation
+import extraction
+import jobs
+import metrics
+import rate_limiter
+import speech
+import translation_memory
+import translator_client
+from translation_engine import iter_translations_multi, split_segments
+from translation_memory import detection_cache, get_translation_memory
+from translator_client import get_translator_client
 
 from urllib3 import disable_warnings, exceptions
 
@@ -22,7 +32,7 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 logger = logging.getLogger(__name__)
 
 # Create a file handler and set level to debug
-log_file_path = os.path.join(os.getcwd(), 'app.log')
+log_file_path = os.environ.get('APP_LOG_PATH', os.path.join(os.getcwd(), 'app.log'))
 file_handler = RotatingFileHandler(log_file_path, maxBytes=1024 * 1024 * 100, backupCount=10)  # 100MB per file, max 10 files
 file_handler.setLevel(logging.INFO)
 
@@ -39,77 +49,48 @@ app.secret_key = 'your_secret_key_here'  # Set a secret key for session manageme
 
 # environment = os.environ.get("ENVIRONMENT")
 
-# Defining Azure AI Translation connections.
-azure_translation_key = os.environ.get("AZURE_TRANSLATION_KEY")
-azure_translation_endpoint = os.environ.get("AZURE_TRANSLATION_ENDPOINT")
-azure_translation_location = os.environ.get(f"AZURE_TRANSLATION_LOCATION")
-
-# # # Configure Speech SDK 
-speech_key = os.environ.get('AZURE_SPEECH_KEY')
-speech_region = os.environ.get('AZURE_SPEECH_REGION')
-speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=speech_region)
-audio_config = speechsdk.audio.AudioOutputConfig(use_default_speaker=True)
-speech_config.speech_synthesis_voice_name = 'en-US-JennyMultilingualNeural'
-speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3)
-speech_synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-
-
-
-# Connection details from the Azure SQL Database
-driver = 'ODBC Driver 18 for SQL Server'
-server = os.environ.get("DB_SERVER")
-database = os.environ.get("DB_NAME")
-username = os.environ.get("DB_USERNAME")
-password = os.environ.get("DB_PASSWORD")
+# Uploads to a streamed route are copied before the view returns; larger ones are copied to disk.
+UPLOAD_SPOOL_MAX_BYTES = 10 * 1024 * 1024
+# Size of the first streamed group; later groups double up to a full request body.
+STREAM_FIRST_GROUP_CHARS = int(os.environ.get('STREAM_FIRST_GROUP_CHARS', 1000))
 
-connect_str = os.environ.get('AZURE_STORAGE_CONNECTION_STRING')
-container_name = 'ai-translation'
+# 'auto' reads the source language from the first translate batch; 'detect' makes a separate /detect call first.
+translation_detect_mode = os.environ.get('TRANSLATION_DETECT_MODE', 'auto')
 
-# Check environment variables
 required_env_vars = [
     "AZURE_TRANSLATION_KEY",
     "AZURE_TRANSLATION_ENDPOINT",
     "AZURE_TRANSLATION_LOCATION"
 ]
-for var in required_env_vars:
-    if not os.environ.get(var):
-        logger.error(f"Missing required environment variable: {var}")
-        raise EnvironmentError(f"Missing required environment variable: {var}")
-
-def upload_file_to_blob(file_stream, file_name):
-    connect_str = os.environ.get('AZURE_STORAGE_CONNECTION_STRING')
-    container_name = 'ai-translation'
-    
-    # Add datetime stamp to the file name
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    file_name_with_timestamp = f"{timestamp}_{file_name}"
-
-    blob_service_client = BlobServiceClient.from_connection_string(connect_str)
-    blob_client = blob_service_client.get_blob_client(container=container_name, blob=file_name_with_timestamp)
-
-    file_stream.seek(0)
-    blob_client.upload_blob(file_stream, overwrite=True)
-
-    blob_url = f"https://{blob_service_client.account_name}.blob.core.windows.net/{container_name}/{file_name_with_timestamp}"
-    return blob_url
-
-def extract_text_from_pdf(pdf_file):
-    text = ""
-    with fitz.open(stream=pdf_file.read(), filetype="pdf") as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
-
-def extract_text_from_docx(docx_file_stream):
-    # Create a temporary file to save the uploaded .docx file
-    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-        # Write the content of the uploaded file to the temporary file
-        docx_file_stream.seek(0)  # Go to the beginning of the file stream
-        tmp_file.write(docx_file_stream.read())
-        # Use the path of the temporary file with docx2txt
-        text = docx2txt.process(tmp_file.name)
-    return text
 
+def check_environment():
+    """Raise EnvironmentError if a required Translator setting is missing."""
+    for var in required_env_vars:
+        if not os.environ.get(var):
+            logger.error(f"Missing required environment variable: {var}")
+            raise EnvironmentError(f"Missing required environment variable: {var}")
+
+def create_app():
+    """Check the configuration and return the app; the entry point for `gunicorn 'app:create_app()'`.
+
+    Importing this module only registers the routes. Azure clients, connection pools, worker
+    threads and the heavy SDKs (PyMuPDF, python-docx, pyodbc, Speech, Blob) are created or
+    imported on first use.
+    """
+    check_environment()
+    return app
+
+@app.before_request
+def start_request_trace():
+    metrics.start_trace(request.endpoint or 'unknown')
+
+@app.after_request
+def finish_request_trace(response):
+    """Record the request's timing; streamed responses are timed until their headers are sent."""
+    trace = metrics.finish_trace(response.status_code)
+    if trace is not None and metrics.SERVER_TIMING:
+        response.headers['Server-Timing'] = metrics.server_timing(trace)
+    return response
 
 # Default page.
 @app.route('/')
@@ -117,257 +98,442 @@ def home():
     logger.info("Serving the home page.")
     return render_template('index.html')
 
-def translate_text(text, azure_translation_key, azure_translation_endpoint, azure_translation_location, target_language):
-    """Detect language and translate text using Azure Translation, handling large texts by splitting them into chunks."""
+def iter_translated_pieces(pieces, target_language, source_language=None, first_group_chars=None):
+    """Translate an iterable of text pieces (pasted text or PDF pages) while it is being produced.
+
+    Yields (source part, translated part, detected language) per group, in document order; see
+    iter_translated_pieces_multi.
+    """
+    for source_part, translated_parts, detected_language in iter_translated_pieces_multi(
+            pieces, [target_language], source_language, first_group_chars):
+        yield source_part, translated_parts[target_language], detected_language
+
+def iter_translated_pieces_multi(pieces, target_languages, source_language=None, first_group_chars=None):
+    """Translate an iterable of text pieces into every target language while it is being produced.
+
+    The source language is taken from the caller, the detection cache, or the first translate
+    batch (or a separate /detect call when TRANSLATION_DETECT_MODE=detect).
+    Yields (source part, {target language: translated part}, detected language) per group, in document order.
+    """
     logger.info("Starting language detection and text translation.")
-    detect_language_path = '/detect'
-    translate_path = '/translate'
-    constructed_detect_url = azure_translation_endpoint + detect_language_path
-    constructed_translate_url = azure_translation_endpoint + translate_path
-
-    session = requests.Session()
-    session.verify = False
-
-    headers = {
-        'Ocp-Apim-Subscription-Key': azure_translation_key,
-        'Ocp-Apim-Subscription-Region': azure_translation_location,
-        'Content-type': 'application/json',
-        'X-ClientTraceId': str(uuid.uuid4())
-    }
-
-    # Detect language
-    body = [{'text': text[:100]}]  # Use a sample of the text for language detection
-    detect_response = session.post(constructed_detect_url, headers=headers, json=body, params={'api-version': '3.0'})
-    if detect_response.status_code != 200:
-        logger.error(f"Language detection API error: {detect_response.text}")
-        raise Exception("Error: Unable to detect language")
-    detected_language = detect_response.json()[0]['language']
+    client = get_translator_client()
+    pieces = iter(pieces)
+    first_piece = next(pieces, '')
+
+    if not source_language:
+        source_language = detection_cache.get(first_piece)
+        if not source_language and translation_detect_mode == 'detect':
+            with metrics.span('detect'):
+                source_language = client.detect([first_piece[:100]])[0]['language']  # Use a sample of the text for language detection
+            detection_cache.put(first_piece, source_language)
+
+    # Split on sentence/paragraph boundaries and translate each group as soon as it is complete
+    detected_language = source_language
+    for source_part, translated_parts, language in iter_translations_multi(itertools.chain([first_piece], pieces),
+                                                                           target_languages, client,
+                                                                           source_language=source_language,
+                                                                           memory=get_translation_memory(),
+                                                                           first_group_chars=first_group_chars):
+        detected_language = detected_language or language
+        yield source_part, translated_parts, detected_language
+    if not source_language and detected_language:
+        detection_cache.put(first_piece, detected_language)
     logger.info(f"Detected language: {detected_language}")
-
-    # Split text into chunks and translate
-    chunk_size = 5000  # Adjust based on API limits
-    chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-    translated_chunks = []
-
-    for chunk in chunks:
-        params = {
-            'api-version': '3.0',
-            'from': detected_language,
-            'to': [target_language]
-        }
-        translate_response = session.post(constructed_translate_url, params=params, headers=headers, json=[{'text': chunk}])
-        if translate_response.status_code != 200:
-            logger.error(f"Translation API error: {translate_response.text}")
-            raise Exception("Error: Unable to translate text")
-        translated_chunk = translate_response.json()[0]['translations'][0]['text']
-        translated_chunks.append(translated_chunk)
-
-    translated_text = ''.join(translated_chunks)
     logger.info("Text translation successful.")
 
+def translate_pieces(pieces, target_language, source_language=None, on_group=None):
+    """Translate pieces and return (source text, translated text, detected language).
+
+    on_group, if given, is called with (source part, translated part) as each group comes back.
+    """
+    source_parts, translated_parts = [], []
+    detected_language = source_language
+    for source_part, translated_part, detected_language in iter_translated_pieces(pieces, target_language,
+                                                                                  source_language):
+        source_parts.append(source_part)
+        translated_parts.append(translated_part)
+        if on_group is not None:
+            on_group(source_part, translated_part)
+    return ''.join(source_parts), ''.join(translated_parts), detected_language
+
+def translate_pieces_multi(pieces, target_languages, source_language=None):
+    """Translate pieces into every target language; returns (source text, {language: translated text}, detected language)."""
+    source_parts = []
+    translated_parts = {language: [] for language in target_languages}
+    detected_language = source_language
+    for source_part, translated, detected_language in iter_translated_pieces_multi(pieces, target_languages,
+                                                                                   source_language):
+        source_parts.append(source_part)
+        for language, translated_part in translated.items():
+            translated_parts[language].append(translated_part)
+    return (''.join(source_parts), {language: ''.join(parts) for language, parts in translated_parts.items()},
+            detected_language)
+
+def translate_text(text, target_language, source_language=None):
+    """Translate text using Azure Translation, batching sentence-level segments concurrently."""
+    _, translated_text, detected_language = translate_pieces([text], target_language, source_language)
     return translated_text, detected_language
 
-def ensure_table_exists(conn_str):
-    create_table_query = """
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'TranslatedDocuments')
-    BEGIN
-        CREATE TABLE TranslatedDocuments (
-            id INT PRIMARY KEY IDENTITY(1,1),
-            input_text NVARCHAR(MAX),
-            detected_language NVARCHAR(100),
-            translated_text NVARCHAR(MAX),
-            output_language NVARCHAR(100),
-            created_at DATETIME2 DEFAULT GETDATE(),
-            blob_url NVARCHAR(MAX),
-            user_ip NVARCHAR(100)  -- Add this line
-        )
-    END
-    ELSE
-    BEGIN
-        IF NOT EXISTS (SELECT * FROM sys.columns 
-                       WHERE Name = N'created_at' AND Object_ID = Object_ID(N'TranslatedDocuments'))
-        BEGIN
-            ALTER TABLE TranslatedDocuments ADD created_at DATETIME2 DEFAULT GETDATE()
-        END
-        IF NOT EXISTS (SELECT * FROM sys.columns 
-                       WHERE Name = N'blob_url' AND Object_ID = Object_ID(N'TranslatedDocuments'))
-        BEGIN
-            ALTER TABLE TranslatedDocuments ADD blob_url NVARCHAR(MAX)
-        END
-        IF NOT EXISTS (SELECT * FROM sys.columns 
-                       WHERE Name = N'user_ip' AND Object_ID = Object_ID(N'TranslatedDocuments'))  -- Add this block
-        BEGIN
-            ALTER TABLE TranslatedDocuments ADD user_ip NVARCHAR(100)
-        END
-    END
+def document_pieces(filename, stream, page_range=None):
+    """Text pieces of an uploaded file (PDF pages and DOCX paragraphs are read lazily), or None if the type is unsupported.
+
+    Raises ValueError if page_range is invalid.
     """
-    try:
-        with pyodbc.connect(conn_str) as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(create_table_query)
-                conn.commit()
-                logger.info("Checked/created/updated table 'TranslatedDocuments'.")
-    except Exception as e:
-        logger.error(f"Failed to check/create/update table: {e}")
-
-def ensure_feedback_table_exists(conn_str):
-    create_feedback_table_query = """
-    IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'Feedback')
-    CREATE TABLE Feedback (
-        id INT PRIMARY KEY IDENTITY(1,1),
-        feedback_text NVARCHAR(MAX),
-        created_at DATETIME2 DEFAULT GETDATE()
-    )
+    if filename.endswith('.pdf'):
+        # Pages are read lazily, so a bad range is reported here rather than halfway through the request
+        extraction.check_page_range(page_range)
+        pieces = extraction.iter_pdf_pages(stream, page_range)
+    elif filename.endswith('.docx'):
+        pieces = extraction.iter_docx_text(stream)
+    elif filename.endswith('.txt'):
+        pieces = [stream.read().decode('utf-8')]
+    else:
+        return None
+    # Only time spent producing pieces counts as extraction, not the translation that consumes them
+    return metrics.timed_iter(pieces, 'extract', 'extracted_chars', format=os.path.splitext(filename)[1][1:])
+
+def store_document(extracted_text, detected_language, translations, upload, user_ip):
+    """Queue the document's rows ({output language: translated text}); with an upload, once the blob exists (the URL is left empty if it failed)."""
+    if upload is None:
+        db.enqueue_document(extracted_text, detected_language, translations, "", user_ip)
+        return
+    blob_url, future = upload
+    future.add_done_callback(lambda done: db.enqueue_document(
+        extracted_text, detected_language, translations, "" if done.exception() else blob_url, user_ip))
+
+def requested_languages(form):
+    """Output languages of a form, in order: repeated 'language' fields and/or comma-separated codes."""
+    languages = [code.strip() for value in form.getlist('language') for code in value.split(',')]
+    return list(dict.fromkeys(code for code in languages if code))
+
+def quota_exceeded_response(error):
+    """429 telling the browser when the shared Translator/Speech quota will have room again."""
+    logger.warning(f"Quota exhausted: {error}")
+    response = jsonify({"error": str(error), "retry_after": round(error.retry_after)})
+    response.headers['Retry-After'] = str(max(1, round(error.retry_after)))
+    return response, 429
+
+def request_pieces(detach=False):
+    """Text pieces from the submitted form and the uploaded file, if any.
+
+    A file overrides the text field. Pieces are None if the file type is unsupported; an invalid
+    page_range raises ValueError. With detach, the pieces read a copy of the upload that stays
+    open after the view returns, for responses that are streamed.
     """
-    try:
-        with pyodbc.connect(conn_str) as conn:
-            with conn.cursor() as cursor:
-                cursor.execute(create_feedback_table_query)
-                conn.commit()
-                logger.info("Checked/created table 'Feedback'.")
-    except Exception as e:
-        logger.error(f"Failed to check/create 'Feedback' table: {e}")
-
-# Directory where the synthesized audio files will be saved
+    pieces = []
+    # Check if text input is provided
+    if 'text' in request.form and request.form['text'].strip():
+        pieces = [request.form['text'].strip()]
+    file = request.files.get('file')
+    if file:
+        stream = file.stream
+        if detach:
+            # Werkzeug closes the request's files when the view returns, before a streamed body is read
+            stream = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES)
+            shutil.copyfileobj(file.stream, stream, extraction.COPY_BUFFER_BYTES)
+            stream.seek(0)
+            file.stream.seek(0)
+        pieces = document_pieces(file.filename, stream, request.form.get('page_range'))
+    return pieces, file
+
+# Directory where the synthesized audio files will be saved (created with the first synthesis)
 audio_files_directory = os.path.join(app.root_path, 'audio_files')
 
-# Create the directory if it does not exist
-if not os.path.exists(audio_files_directory):
-    os.makedirs(audio_files_directory)
-
-# Global variable to track the last synthesis time
-last_speech_synthesis_time = None
-minimum_interval_seconds = 5  # Minimum allowed interval between syntheses
-
 @app.route('/synthesize_speech', methods=['POST'])
 def synthesize_speech():
+    """Start (or reuse) synthesis of the text; the audio streams from /audio/<filename> while it is produced.
+
+    Answers once the first audio is ready, with a 500 if synthesis fails before that.
+    """
     data = request.get_json()
     text = data['text']
     language = data['language']
 
-    # Generate a unique filename for each synthesis request
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-    filename = f"output_{timestamp}.mp3"
-    
-    # Initialize the speech synthesizer with explicit voice and output format
-    speech_key = os.environ.get('AZURE_SPEECH_KEY')
-    speech_region = os.environ.get('AZURE_SPEECH_REGION')
-    if not speech_key or not speech_region:
-        raise ValueError("Azure speech service credentials are not set.")
-
-    speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=speech_region)
-    speech_config.speech_synthesis_voice_name = 'en-US-JennyMultilingualNeural'
-    speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3)
-    
-    audio_config = speechsdk.audio.AudioOutputConfig(filename=os.path.join(audio_files_directory, filename))
-    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-    
-    # Perform the speech synthesis
-    result = synthesizer.speak_text_async(text).get()
-    
-    if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-        logger.info(f"Speech synthesized to '{filename}'")
-        return jsonify({"message": "Speech synthesized successfully", "filename": filename}), 200
-    else:
-        logger.error("Speech synthesis failed.")
+    key = speech.submit_synthesis(text, audio_files_directory)
+    filename = speech.audio_filename(key)
+    # With "async": true callers poll /speech_jobs/<job_id> until the file is complete
+    if data.get('async'):
+        return jsonify({"job_id": key, "status_url": f"/speech_jobs/{key}", "filename": filename}), 202
+    job = speech.wait_for_audio(key, audio_files_directory)
+    if job is None or job['status'] == 'failed':
         return jsonify({"error": "Speech synthesis failed"}), 500
+    return jsonify({"message": "Speech synthesis started", "filename": filename}), 200
+
+@app.route('/speech_jobs/<job_id>')
+def speech_job_status(job_id):
+    """Report the status of a synthesis job; the audio is at /audio/<filename>."""
+    job = speech.get_job(job_id, audio_files_directory)
+    if job is None:
+        abort(404)
+    return jsonify({"job_id": job_id, "status": job['status'], "filename": job['filename'], "error": job['error']}), 200
 
 @app.route('/translate_and_insert', methods=['POST'])
 def translate_and_insert():
-    # Initialize blob_url to None
-    blob_url = None
-    
-    extracted_text = ""
-    # Check if text input is provided
-    if 'text' in request.form and request.form['text'].strip():
-        extracted_text = request.form['text'].strip()
-        # Synthesize speech for the input text
-        speech_synthesis_result = speech_synthesizer.speak_text_async(extracted_text).get()
-        if speech_synthesis_result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
-            logger.error("Failed to synthesize speech for the input text.")
-    # Check if a file is uploaded; this will override text input if both are provided
-    if 'file' in request.files and request.files['file']:
-        file = request.files['file']
-        if file.filename.endswith('.pdf'):
-            extracted_text = extract_text_from_pdf(file.stream)
-        elif file.filename.endswith('.docx'):
-            extracted_text = extract_text_from_docx(file.stream)
-        elif file.filename.endswith('.txt'):
-            extracted_text = file.stream.read().decode('utf-8')
-        else:
-            return jsonify({"error": "Unsupported file type"}), 400
-        # Upload the file to Azure Blob Storage and get the blob URL
-        blob_url = upload_file_to_blob(file.stream, file.filename)
+    upload = None
 
-    # Proceed with translation and database insertion as before
-    # Ensure blob_url is handled correctly when it's None
-    output_language = request.form['language']
+    # Several output languages are translated together, each segment sent once for all of them
+    output_languages = requested_languages(request.form)
+    if not output_languages:
+        return jsonify({"error": "No output language given"}), 400
 
+    # Text pieces to translate; PDF pages are extracted lazily so translation starts with the first page
     try:
-        # Use 'extracted_text' instead of 'input_text'
-        translated_text, detected_language = translate_text(extracted_text, azure_translation_key, azure_translation_endpoint, azure_translation_location, output_language)
-
-        # Synthesize speech for the translated text
-        speech_synthesis_result = speech_synthesizer.speak_text_async(translated_text).get()
-        if speech_synthesis_result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
-            logger.error("Failed to synthesize speech for the translated text.")
-
-        # Define your connection string (adjusted for your application's needs)
-        conn_str = (
-            f"DRIVER={{{driver}}};"
-            f"SERVER={server};"
-            f"DATABASE={database};"
-            f"UID={username};"
-            f"PWD={password};"
-            "TrustServerCertificate=yes;"
-            "Connection Timeout=500;"
-        )
-
-        # Ensure the table exists before inserting data
-        ensure_table_exists(conn_str)
-
-        # Connect to the database
-        connection = pyodbc.connect(conn_str)
-        cursor = connection.cursor()
+        pieces, file = request_pieces()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if pieces is None:
+        return jsonify({"error": "Unsupported file type"}), 400
+    if file:
+        # Upload the file to Azure Blob Storage in the background while the text is translated
+        upload = blob_storage.submit_upload(file.stream, file.filename)
+
+    # Callers that already know the input language can skip detection entirely
+    source_language = request.form.get('source_language') or None
+
+    try:
+        extracted_text, translations, detected_language = translate_pieces_multi(pieces, output_languages,
+                                                                                 source_language)
 
         # Extract the user's IP address
         user_ip = request.remote_addr
 
-        # Update your insert query to include the user_ip
-        insert_query = """INSERT INTO TranslatedDocuments (input_text, detected_language, translated_text, output_language, blob_url, user_ip) VALUES (?, ?, ?, ?, ?, ?)"""
-
-        # Include 'user_ip' in the cursor.execute call
-        cursor.execute(insert_query, (extracted_text, detected_language, translated_text, output_language, blob_url if blob_url else "", user_ip))
-        connection.commit()
+        # Persist the record in the background so the response doesn't wait on the database or the upload
+        store_document(extracted_text, detected_language, translations, upload, user_ip)
 
-        return jsonify({"message": "Data inserted successfully", "translated_text": translated_text, "detected_language": detected_language, "output_language": output_language}), 200
+        response = translation_response(translations, detected_language)
+        # Audio is never synthesized on this path; callers can ask for a background job and poll /speech_jobs/<id>
+        if request.form.get('synthesize_speech') == 'true':
+            add_speech_jobs(response, translations)
+        return jsonify(response), 200
 
+    except extraction.DocumentTooLargeError as e:
+        logger.warning(f"Rejected upload: {e}")
+        return jsonify({"error": str(e)}), 413
+    except rate_limiter.QuotaExceededError as e:
+        return quota_exceeded_response(e)
     except Exception as e:
         logger.error(f"Failed to translate and insert data: {e}")
         return jsonify({"error": "Failed to translate and insert data"}), 500
 
+def translation_response(translations, detected_language):
+    """/translate_and_insert body: the single-language fields, or a 'translations' map for several languages."""
+    if len(translations) == 1:
+        (output_language, translated_text), = translations.items()
+        return {"message": "Data queued for insertion", "translated_text": translated_text,
+                "detected_language": detected_language, "output_language": output_language}
+    return {"message": "Data queued for insertion", "translations": translations,
+            "detected_language": detected_language, "output_languages": list(translations)}
+
+def add_speech_jobs(response, translations):
+    """Start a synthesis job per translation: 'speech_job_id' for one language, 'speech_job_ids' by language otherwise."""
+    jobs_by_language = {language: speech.submit_synthesis(translated_text, audio_files_directory)
+                        for language, translated_text in translations.items()}
+    if len(jobs_by_language) == 1:
+        response["speech_job_id"], = jobs_by_language.values()
+    else:
+        response["speech_job_ids"] = jobs_by_language
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/translate_stream', methods=['POST'])
+def translate_stream():
+    """Like /translate_and_insert, but streams translated text as server-sent events in document order.
+
+    Emits a `segment` event per translated group, then `done` (or `error`). The first group is kept
+    small so the first text arrives after one short request.
+    """
+    output_languages = requested_languages(request.form)
+    if len(output_languages) != 1:
+        return jsonify({"error": "Give exactly one output language to stream"}), 400
+    output_language = output_languages[0]
+    try:
+        pieces, file = request_pieces(detach=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if pieces is None:
+        return jsonify({"error": "Unsupported file type"}), 400
+    upload = blob_storage.submit_upload(file.stream, file.filename) if file else None
+    source_language = request.form.get('source_language') or None
+    synthesize = request.form.get('synthesize_speech') == 'true'
+    user_ip = request.remote_addr
+
+    def events():
+        source_parts, translated_parts = [], []
+        detected_language = source_language
+        try:
+            for index, (source_part, translated_part, detected_language) in enumerate(
+                    iter_translated_pieces(pieces, output_language, source_language, STREAM_FIRST_GROUP_CHARS)):
+                source_parts.append(source_part)
+                translated_parts.append(translated_part)
+                yield sse_event('segment', {"index": index, "text": translated_part, "detected_language": detected_language})
+            translated_text = ''.join(translated_parts)
+            store_document(''.join(source_parts), detected_language, {output_language: translated_text}, upload, user_ip)
+            done = {"detected_language": detected_language, "output_language": output_language}
+            if synthesize:
+                done["speech_job_id"] = speech.submit_synthesis(translated_text, audio_files_directory)
+            yield sse_event('done', done)
+        except rate_limiter.QuotaExceededError as e:
+            logger.warning(f"Quota exhausted: {e}")
+            yield sse_event('error', {"error": str(e), "retry_after": round(e.retry_after)})
+        except Exception as e:
+            logger.error(f"Failed to stream translation: {e}")
+            yield sse_event('error', {"error": "Failed to translate and insert data"})
+
+    # No proxy buffering, so each event reaches the browser as soon as it is written
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+JOB_STAGES = ('extract', 'translate', 'upload', 'store', 'speech')
+
+def run_translation_job(job, text, upload_path, filename, output_language, source_language, page_range,
+                        synthesize, user_ip):
+    """The /translate_and_insert pipeline, run on a job worker with progress reporting.
+
+    Jobs are not waited on by a browser request, so they use batch quota priority.
+    """
+    stream = open(upload_path, 'rb') if upload_path else None
+    try:
+        upload = blob_storage.submit_upload(stream, filename)[1] if stream else None
+        pieces = document_pieces(filename, stream, page_range) if stream else [text]
+
+        def counted(pieces):
+            # Text and DOCX uploads count as a single page
+            for piece in pieces:
+                job.advance('pages_extracted')
+                yield piece
+            job.set_stage('extract', 'completed')
+
+        def on_group(source_part, translated_part):
+            job.advance('characters_translated', len(source_part))
+            job.advance('segments_translated', sum(1 for segment in split_segments(source_part) if segment.strip()))
+            job.add_part(translated_part)
+
+        job.set_stage('extract', 'running')
+        with job.stage('translate'), rate_limiter.priority(rate_limiter.BATCH):
+            extracted_text, translated_text, detected_language = translate_pieces(counted(pieces), output_language,
+                                                                                  source_language, on_group)
+
+        blob_url = None
+        if upload:
+            job.set_stage('upload', 'running')
+            try:
+                blob_url = upload.result()
+                job.set_stage('upload', 'completed')
+            except Exception as e:
+                # The translation is still good; keep it, without a blob URL, like translate_and_insert does
+                logger.error(f"Blob upload for job {job.id} failed; storing it without a URL: {e}")
+                job.set_stage('upload', 'failed')
+        else:
+            job.set_stage('upload', 'skipped')
+
+        with job.stage('store'):
+            db.get_document_writer().enqueue((extracted_text, detected_language, translated_text, output_language, blob_url if blob_url else "", user_ip))
+
+        speech_job_id = None
+        if synthesize:
+            with job.stage('speech'):
+                speech_job_id = speech.submit_synthesis(translated_text, audio_files_directory)
+        else:
+            job.set_stage('speech', 'skipped')
+
+        return {"translated_text": translated_text, "detected_language": detected_language,
+                "output_language": output_language, "blob_url": blob_url, "speech_job_id": speech_job_id}
+    finally:
+        if stream:
+            stream.close()
+            os.remove(upload_path)
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a translation with the same form fields as /translate_and_insert and return its job id at once."""
+    text = request.form.get('text', '').strip()
+    file = request.files.get('file')
+    # Everything is checked before the upload is spooled, so a bad request leaves nothing behind
+    if file and not file.filename.endswith(('.pdf', '.docx', '.txt')):
+        return jsonify({"error": "Unsupported file type"}), 400
+    if not file and not text:
+        return jsonify({"error": "Provide text or a file"}), 400
+    output_languages = requested_languages(request.form)
+    if len(output_languages) != 1:
+        return jsonify({"error": "Give exactly one output language for a job"}), 400
+    page_range = request.form.get('page_range')
+    try:
+        extraction.check_page_range(page_range)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    upload_path, filename = None, None
+    if file:
+        filename = file.filename
+        # The request stream is gone once we respond, so the worker reads a spooled copy
+        upload_path = extraction.spool_to_disk(file.stream, suffix=os.path.splitext(filename)[1])
+
+    job = jobs.submit(run_translation_job, text, upload_path, filename, output_languages[0],
+                      request.form.get('source_language') or None, page_range,
+                      request.form.get('synthesize_speech') == 'true', request.remote_addr, stages=JOB_STAGES)
+    return jsonify({"job_id": job.id, "status_url": f"/jobs/{job.id}", "result_url": f"/jobs/{job.id}/result"}), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Per-stage status, progress counters and the translated parts from ?since=<n> on."""
+    snapshot = jobs.get_snapshot(job_id, request.args.get('since', 0, type=int))
+    if snapshot is None:
+        abort(404)
+    snapshot.pop('result')
+    return jsonify(snapshot), 200
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """The finished job's result as JSON, or the translated text as a download with ?format=txt."""
+    snapshot = jobs.get_snapshot(job_id)
+    if snapshot is None:
+        abort(404)
+    if snapshot['status'] == 'failed':
+        return jsonify({"error": snapshot['error']}), 500
+    if snapshot['status'] != 'completed':
+        return jsonify({"status": snapshot['status']}), 409
+    result = snapshot['result']
+    if request.args.get('format') == 'txt':
+        return Response(result['translated_text'], mimetype='text/plain; charset=utf-8',
+                        headers={"Content-Disposition": f"attachment; filename={job_id}_{result['output_language']}.txt"})
+    return jsonify(result), 200
+
+@app.route('/translate_document', methods=['POST'])
+def translate_document():
+    """Translate an uploaded PDF or DOCX in place and return the translated file as a download."""
+    file = request.files.get('file')
+    if not file or not file.filename.endswith(('.pdf', '.docx')):
+        return jsonify({"error": "Upload a .pdf or .docx file"}), 400
+    output_language = request.form['language']
+    source_language = request.form.get('source_language') or None
+
+    try:
+        if file.filename.endswith('.pdf'):
+            translate, mimetype = document_translation.translate_pdf, document_translation.PDF_MIMETYPE
+        else:
+            translate, mimetype = document_translation.translate_docx, document_translation.DOCX_MIMETYPE
+        data, detected_language = translate(file.stream, output_language, get_translator_client(),
+                                            source_language, memory=get_translation_memory())
+    except rate_limiter.QuotaExceededError as e:
+        return quota_exceeded_response(e)
+    except Exception as e:
+        logger.error(f"Failed to translate document: {e}")
+        return jsonify({"error": "Failed to translate document"}), 500
+
+    stem, extension = os.path.splitext(file.filename)
+    response = send_file(io.BytesIO(data), mimetype=mimetype, as_attachment=True,
+                         download_name=f"{stem}_{output_language}{extension}")
+    response.headers['X-Detected-Language'] = detected_language or ''
+    return response
+
 @app.route('/submit_feedback', methods=['POST'])
 def submit_feedback():
     data = request.get_json()
     feedback_text = data['feedback']
 
     try:
-        # Define your connection string (adjusted for your application's needs)
-        conn_str = (
-            f"DRIVER={{{driver}}};"
-            f"SERVER={server};"
-            f"DATABASE={database};"
-            f"UID={username};"
-            f"PWD={password};"
-            "TrustServerCertificate=yes;"
-            "Connection Timeout=60;"
-        )
-
-        # Ensure the Feedback table exists before inserting data
-        ensure_feedback_table_exists(conn_str)
-
-        # Connect to the database
-        with pyodbc.connect(conn_str) as conn:
+        with db.connection() as conn:
             with conn.cursor() as cursor:
                 # Insert feedback into the database
                 insert_query = """INSERT INTO Feedback (feedback_text) VALUES (?)"""
@@ -385,19 +551,9 @@ def submit_feedback():
 def update_ratings():
     data = request.get_json()
     action = data['action']
-    
-    conn_str = (
-        f"DRIVER={{{driver}}};"
-        f"SERVER={server};"
-        f"DATABASE={database};"
-        f"UID={username};"
-        f"PWD={password};"
-        "TrustServerCertificate=yes;"
-        "Connection Timeout=30;"
-    )
-    
+
     try:
-        with pyodbc.connect(conn_str) as conn:
+        with db.connection() as conn:
             with conn.cursor() as cursor:
                 if action == "A is better":
                     cursor.execute("UPDATE ModelRatings SET ratingA = ratingA + 1 WHERE id = 1")
@@ -415,11 +571,52 @@ def update_ratings():
 
 @app.route('/audio/<filename>')
 def get_audio(filename):
-    """Serve an audio file from the 'audio_files' directory."""
+    """Serve an audio file from the 'audio_files' directory, streaming it if synthesis is still running."""
+    stream = speech.open_stream(filename, audio_files_directory)
+    if stream is not None:
+        return Response(stream, mimetype='audio/mpeg')
     if not os.path.exists(os.path.join(audio_files_directory, filename)):
         abort(404)  # Return a 404 if the file does not exist
-    return send_from_directory(audio_files_directory, filename, mimetype='audio/mpeg')
+    # conditional=True answers Range requests so the browser can seek
+    return send_from_directory(audio_files_directory, filename, mimetype='audio/mpeg', conditional=True)
+
+# In-process counters of each component, reported by /stats and exported as gauges on /metrics.
+# A scrape never creates a component: one this process has not used yet reports {}.
+STATS_SOURCES = {
+    "translation_memory": translation_memory.stats,
+    "translator_client": translator_client.stats,
+    "detection_cache": detection_cache.stats,
+    "db_pool": db.pool_stats,
+    "document_writer": db.document_writer_stats,
+    "multi_target_writer": db.multi_target_writer_stats,
+    "speech": speech.stats,
+    "jobs": jobs.stats,
+    "blob_storage": blob_storage.stats,
+    "quota": rate_limiter.stats,
+}
+for name, collect in STATS_SOURCES.items():
+    metrics.register_collector(name, collect)
+
+@app.route('/stats')
+def stats():
+    """Report in-process cache and Translator client counters, and the shared quota usage."""
+    return jsonify({name: collect() for name, collect in STATS_SOURCES.items()}), 200
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage timings, counters and component stats of this worker process in the Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/slow')
+def slow_requests():
+    """The most recent sampled traces of requests slower than SLOW_REQUEST_SECONDS, with time per stage."""
+    return jsonify(metrics.slow_traces()), 200
+
+@app.cli.command('migrate-db')
+def migrate_db():
+    """Create or upgrade the database tables; run once per deploy."""
+    db.migrate_schema()
 
 if __name__ == '__main__':
     logger.info("Starting the Flask application...")
-    app.run(debug=True)
+    create_app().run(debug=True)
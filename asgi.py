@@ -0,0 +1,193 @@
+"""ASGI entry point: /translate_and_insert runs on asyncio, every other route is the Flask app.
+
+Serve it with a single async worker per core, for example:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 8000
+
+A worker keeps many translations in flight at once instead of blocking on each one, so
+throughput no longer depends on the number of gunicorn sync workers.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.wrappers import Request
+
+import async_pipeline
+import db
+import extraction
+import metrics
+import rate_limiter
+from app import add_speech_jobs, create_app, document_pieces, requested_languages, translation_response
+
+logger = logging.getLogger(__name__)
+
+# Request bodies larger than this are spooled to disk while they are read.
+SPOOL_MAX_BYTES = 10 * 1024 * 1024
+# Threads running Flask routes; each one holds a request for its full duration, streams included.
+FLASK_THREADS = int(os.environ.get('ASGI_FLASK_THREADS', 16))
+
+_flask_executor = ThreadPoolExecutor(max_workers=FLASK_THREADS, thread_name_prefix='flask')
+
+
+class _WsgiToAsgiInstance(WsgiToAsgiInstance):
+    # asgiref runs every WSGI request on one shared thread by default, which serializes the Flask
+    # routes and breaks when they overlap; run them on a pool instead. run_wsgi_app is not public
+    # API, so asgiref is pinned in requirements.txt; check this before raising the pin.
+    run_wsgi_app = sync_to_async(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False,
+                                 executor=_flask_executor)
+
+
+class _WsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await _WsgiToAsgiInstance(self.wsgi_application)(scope, receive, send)
+
+
+flask_application = _WsgiToAsgi(create_app())
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/translate_and_insert' and scope['method'] == 'POST':
+        await traced('translate_and_insert', translate_and_insert, scope, receive, send)
+    else:
+        await flask_application(scope, receive, send)
+
+
+async def traced(name, handler, scope, receive, send):
+    """Run a native handler with a request trace, like the Flask before/after_request hooks."""
+    metrics.start_trace(name)
+
+    async def send_with_timing(message):
+        if message['type'] == 'http.response.start':
+            trace = metrics.finish_trace(message['status'])
+            if trace is not None and metrics.SERVER_TIMING:
+                timing = metrics.server_timing(trace).encode('latin-1')
+                message = dict(message, headers=[*message.get('headers', []), (b'server-timing', timing)])
+        await send(message)
+
+    await handler(scope, receive, send_with_timing)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_pipeline.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def read_request(scope, receive):
+    """Read the body and parse the form with werkzeug, the same way Flask would."""
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get('body', b'')
+        body.write(chunk)
+        size += len(chunk)
+        more_body = message.get('more_body', False)
+    body.seek(0)
+
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'CONTENT_TYPE': headers.get('content-type', ''),
+        'CONTENT_LENGTH': str(size),
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'SERVER_NAME': 'asgi',
+        'SERVER_PORT': '0',
+        'wsgi.input': body,
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+    }
+    request = Request(environ)
+    # Multipart parsing is CPU work on a possibly large body
+    await async_pipeline.to_thread(lambda: (request.form, request.files))
+    return request
+
+
+async def send_json(send, status, payload, headers=()):
+    data = json.dumps(payload).encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(data)).encode()),
+                            *headers]})
+    await send({'type': 'http.response.body', 'body': data})
+
+
+async def translate_and_insert(scope, receive, send):
+    """Async version of app.translate_and_insert with the same form fields and response."""
+    request = await read_request(scope, receive)
+    pieces = []
+    if request.form.get('text', '').strip():
+        pieces = [request.form['text'].strip()]
+    file = request.files.get('file')
+    data = None
+    if file:
+        data = await async_pipeline.to_thread(file.read)
+        try:
+            pieces = document_pieces(file.filename, io.BytesIO(data), request.form.get('page_range'))
+        except ValueError as e:
+            await send_json(send, 400, {"error": str(e)})
+            return
+        if pieces is None:
+            await send_json(send, 400, {"error": "Unsupported file type"})
+            return
+    output_languages = requested_languages(request.form)
+    if not output_languages:
+        await send_json(send, 400, {"error": "No output language given"})
+        return
+    source_language = request.form.get('source_language') or None
+
+    upload = None
+    try:
+        # The blob upload runs while the document is extracted and translated
+        if file:
+            upload = asyncio.create_task(async_pipeline.upload_file_to_blob(data, file.filename))
+        extracted_text = await async_pipeline.to_thread(''.join, pieces)
+        translations, detected_language = await async_pipeline.translate_text_multi(extracted_text, output_languages,
+                                                                                    source_language)
+        blob_url = None
+        if upload:
+            try:
+                blob_url = await upload
+            except Exception as e:
+                # Same as the Flask route: the row is stored without a URL
+                logger.error(f"Blob upload failed; storing the document without a URL: {e}")
+
+        await async_pipeline.to_thread(db.enqueue_document, extracted_text, detected_language, translations,
+                                       blob_url, request.remote_addr)
+
+        response = translation_response(translations, detected_language)
+        if request.form.get('synthesize_speech') == 'true':
+            add_speech_jobs(response, translations)
+        await send_json(send, 200, response)
+
+    except extraction.DocumentTooLargeError as e:
+        if upload is not None and not upload.done():
+            upload.cancel()
+        logger.warning(f"Rejected upload: {e}")
+        await send_json(send, 413, {"error": str(e)})
+    except rate_limiter.QuotaExceededError as e:
+        if upload is not None and not upload.done():
+            upload.cancel()
+        logger.warning(f"Quota exhausted: {e}")
+        await send_json(send, 429, {"error": str(e), "retry_after": round(e.retry_after)},
+                        [(b'retry-after', str(max(1, round(e.retry_after))).encode())])
+    except Exception as e:
+        if upload is not None and not upload.done():
+            upload.cancel()
+        logger.error(f"Failed to translate and insert data: {e}")
+        await send_json(send, 500, {"error": "Failed to translate and insert data"})
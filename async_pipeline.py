@@ -0,0 +1,267 @@
+"""Asyncio versions of the Translator and Blob calls, used by the ASGI entry point (asgi.py).
+
+One event loop keeps many translations in flight on a single worker: Translator requests go
+through a shared aiohttp session, uploads through the aio Blob client, and the blocking pieces
+that remain (SQLite translation memory, PDF extraction, pyodbc) run on worker threads.
+"""
+import asyncio
+import contextvars
+import functools
+import hashlib
+import logging
+import os
+import uuid
+
+import aiohttp
+
+import blob_storage
+import metrics
+import rate_limiter
+from translation_engine import (MAX_IN_FLIGHT, _restore_whitespace, detect_batch, pack_requests,
+                                read_translations, split_segments)
+from translation_memory import detection_cache, get_translation_memory
+from translator_client import (API_VERSION, DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_RETRIES, DEFAULT_POOL_SIZE,
+                               DEFAULT_READ_TIMEOUT, RETRY_STATUSES, TranslatorClient, TranslatorError)
+
+logger = logging.getLogger(__name__)
+
+# Translator connections per worker process; an event loop can use far more than a thread pool could.
+ASYNC_POOL_SIZE = int(os.environ.get('TRANSLATOR_ASYNC_POOL_SIZE', DEFAULT_POOL_SIZE * 4))
+
+
+async def to_thread(func, *args, **kwargs):
+    """asyncio.to_thread, which Python 3.8 lacks: run func on the loop's default executor in the caller's context."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, func, *args, **kwargs))
+
+
+class AsyncTranslatorClient:
+    """aiohttp Translator client with the same retry, backoff and timeout behaviour as TranslatorClient."""
+
+    def __init__(self, key, endpoint, location, pool_size=ASYNC_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT, verify=False,
+                 quota=None):
+        self.endpoint = endpoint.rstrip('/')
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self.quota = quota
+        self.verify = verify
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._headers = {
+            'Ocp-Apim-Subscription-Key': key,
+            'Ocp-Apim-Subscription-Region': location,
+            'Content-type': 'application/json',
+        }
+        self._session = None
+        self._counters = {'requests': 0, 'retries': 0, 'throttled': 0, 'server_errors': 0,
+                          'timeouts': 0, 'connection_errors': 0, 'failures': 0}
+
+    def _get_session(self):
+        # Created lazily so it binds to the running event loop.
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, ssl=None if self.verify else False)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=self._headers)
+        return self._session
+
+    async def translate(self, texts, to, source_language=None, **extra_params):
+        params = [('to', language) for language in to] + list(extra_params.items())
+        if source_language:
+            params.append(('from', source_language))
+        return await self.post('/translate', params, [{'text': text} for text in texts],
+                               "Error: Unable to translate text", chars=sum(map(len, texts)) * len(to))
+
+    async def detect(self, texts):
+        return await self.post('/detect', [], [{'text': text} for text in texts], "Error: Unable to detect language",
+                               chars=sum(map(len, texts)))
+
+    async def post(self, path, params, body, error_message="Error: Translator request failed", chars=0):
+        url = self.endpoint + path
+        params = [('api-version', API_VERSION)] + list(params)
+        stage = f"translator{path.replace('/', '_')}"
+        if self.quota is not None:
+            # The shared bucket is a SQLite file, so waiting on it happens off the event loop
+            waited = await to_thread(self.quota.acquire, chars)
+            if waited:
+                metrics.observe('quota_wait', waited)
+        metrics.count('translator_chars', chars, path=path)
+        session = self._get_session()
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            self._counters['requests'] += 1
+            try:
+                with metrics.span(stage):
+                    async with session.post(url, params=params, json=body,
+                                            headers={'X-ClientTraceId': str(uuid.uuid4())}) as response:
+                        if response.status == 200:
+                            return await response.json()
+                        if response.status not in RETRY_STATUSES:
+                            self._counters['failures'] += 1
+                            logger.error(f"Translator API error on {path}: {response.status} {await response.text()}")
+                            raise TranslatorError(error_message)
+                        self._counters['throttled' if response.status == 429 else 'server_errors'] += 1
+                        retry_after = response.headers.get('Retry-After')
+                        reason = f"HTTP {response.status}"
+            except asyncio.TimeoutError as e:
+                self._counters['timeouts'] += 1
+                reason = f"timeout: {e}"
+            except aiohttp.ClientConnectionError as e:
+                self._counters['connection_errors'] += 1
+                reason = f"connection error: {e}"
+
+            if attempt == self.max_retries:
+                break
+            delay = TranslatorClient._backoff_delay(attempt, retry_after)
+            if retry_after and self.quota is not None:
+                await to_thread(self.quota.pause, delay)
+            self._counters['retries'] += 1
+            logger.warning(f"Translator {path} failed ({reason}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s.")
+            await asyncio.sleep(delay)
+
+        self._counters['failures'] += 1
+        logger.error(f"Translator API error on {path}: giving up after {self.max_retries + 1} attempts ({reason}).")
+        raise TranslatorError(error_message)
+
+    def stats(self):
+        return dict(self._counters, pool_size=self.pool_size)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+_client = None
+_blob_service_client = None
+
+
+def get_async_translator_client():
+    """Return the process-wide async Translator client; only call it from the event loop thread."""
+    global _client
+    if _client is None:
+        _client = AsyncTranslatorClient(
+            key=os.environ.get("AZURE_TRANSLATION_KEY"),
+            endpoint=os.environ.get("AZURE_TRANSLATION_ENDPOINT"),
+            location=os.environ.get("AZURE_TRANSLATION_LOCATION"),
+            verify=os.environ.get('TRANSLATOR_VERIFY_SSL', 'false').lower() == 'true',
+            quota=rate_limiter.get_translator_quota(),
+        )
+    return _client
+
+
+async def translate_segments(segments, target_language, client, source_language=None,
+                             max_in_flight=MAX_IN_FLIGHT, memory=None):
+    """Async counterpart of translation_engine.translate_segments; returns (translated segments, source language)."""
+    translated, source_language = await translate_segments_multi(segments, [target_language], client, source_language,
+                                                                 max_in_flight=max_in_flight, memory=memory)
+    return translated[target_language], source_language
+
+
+async def translate_segments_multi(segments, target_languages, client, source_language=None,
+                                   max_in_flight=MAX_IN_FLIGHT, memory=None):
+    """Async counterpart of translation_engine.translate_segments_multi.
+
+    Returns ({target language: translated segments}, source language).
+    """
+    pending = [(index, segment.strip()) for index, segment in enumerate(segments) if segment.strip()]
+    texts = list(dict.fromkeys(text for _, text in pending))
+    translated = {language: {} for language in target_languages}
+
+    async def remember(fresh):
+        if memory is not None:
+            for language, translations in fresh.items():
+                if translations:
+                    await to_thread(memory.put_many, source_language, language, list(translations.items()))
+
+    if not source_language and texts:
+        languages, batch = pack_requests(detect_batch(texts), translated, target_languages)[0]
+        items = await client.translate([text for _, text in batch], languages)
+        source_language = items[0]['detectedLanguage']['language']
+        logger.info(f"Detected language from first batch: {source_language}")
+        await remember(read_translations(languages, batch, items, translated))
+
+    cached = 0
+    if memory is not None and source_language:
+        for language in target_languages:
+            hits = await to_thread(memory.get_many, source_language, language,
+                                           {text for text in texts if text not in translated[language]})
+            translated[language].update(hits)
+            cached += len(hits)
+    requests = pack_requests(texts, translated, target_languages)
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def send(languages, batch):
+        async with semaphore:
+            return await client.translate([text for _, text in batch], languages, source_language)
+
+    logger.info(f"Translating {len(texts)} segments into {len(target_languages)} languages in {len(requests)} "
+                f"requests ({cached} from translation memory).")
+    fresh = {language: {} for language in target_languages}
+    responses = await asyncio.gather(*(send(*request) for request in requests))
+    for (languages, batch), items in zip(requests, responses):
+        for language, translations in read_translations(languages, batch, items, translated).items():
+            fresh[language].update(translations)
+    await remember(fresh)
+
+    results = {}
+    for language in target_languages:
+        results[language] = list(segments)
+        for index, text in pending:
+            results[language][index] = _restore_whitespace(segments[index], translated[language][text])
+    return results, source_language
+
+
+async def translate_text(text, target_language, source_language=None):
+    """Translate text on the event loop; returns (translated text, detected language)."""
+    translations, source_language = await translate_text_multi(text, [target_language], source_language)
+    return translations[target_language], source_language
+
+
+async def translate_text_multi(text, target_languages, source_language=None):
+    """Translate text into every target language in shared requests; returns ({language: text}, detected language)."""
+    if not source_language:
+        source_language = detection_cache.get(text)
+    known = source_language
+    translated, source_language = await translate_segments_multi(split_segments(text), target_languages,
+                                                                 get_async_translator_client(), source_language,
+                                                                 memory=get_translation_memory())
+    if not known and source_language:
+        detection_cache.put(text, source_language)
+    return {language: ''.join(parts) for language, parts in translated.items()}, source_language
+
+
+async def upload_file_to_blob(data, file_name):
+    """Upload bytes under their content-hash name with the aio Blob client and return the blob URL.
+
+    A blob that already exists is not uploaded again.
+    """
+    # Imported with the first upload, like the sync client in blob_storage
+    from azure.core.exceptions import ResourceExistsError
+    from azure.storage.blob.aio import BlobServiceClient
+
+    global _blob_service_client
+    if _blob_service_client is None:
+        _blob_service_client = BlobServiceClient.from_connection_string(
+            os.environ.get('AZURE_STORAGE_CONNECTION_STRING'),
+            max_single_put_size=blob_storage.MAX_SINGLE_PUT_BYTES, max_block_size=blob_storage.MAX_BLOCK_BYTES)
+
+    digest = await to_thread(lambda: hashlib.sha256(data).hexdigest())
+    blob_client = _blob_service_client.get_blob_client(container=blob_storage.CONTAINER_NAME,
+                                                       blob=blob_storage.blob_name(digest, file_name))
+    if await blob_client.exists():
+        return blob_client.url
+    try:
+        await blob_client.upload_blob(data, overwrite=False, max_concurrency=blob_storage.UPLOAD_CONCURRENCY,
+                                      content_settings=blob_storage.content_settings(file_name))
+    except ResourceExistsError:
+        pass  # Uploaded concurrently by another request
+    return blob_client.url
+
+
+async def close():
+    """Close the shared HTTP sessions; called on ASGI shutdown."""
+    global _client, _blob_service_client
+    if _client is not None:
+        await _client.close()
+        _client = None
+    if _blob_service_client is not None:
+        await _blob_service_client.close()
+        _blob_service_client = None
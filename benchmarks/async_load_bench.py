@@ -0,0 +1,178 @@
+"""Load-test /translate_and_insert on gunicorn sync workers versus the asyncio ASGI entry point.
+
+Both servers run benchmarks.offline_app (the app wired to the local stand-ins, with all of its
+state in a temporary BENCH_WORKDIR) against the stub Translator with the same simulated latency,
+so no Azure resource or production state is touched. The async server runs as one uvicorn
+process; the sync server gets as many gunicorn workers as fit in the same memory, so the
+comparison is at a fixed memory budget. The budget defaults to the larger of the async server and
+a one-worker gunicorn (master plus worker, measured RSS). gunicorn runs with `-c /dev/null`, so
+the repository's gunicorn.conf.py (preload and SDK imports in the master) does not apply to either
+side. A budget that cannot hold one sync worker is an error, and so is a side that ends up more
+than BUDGET_TOLERANCE over the budget.
+
+Run from the repository root (the app's dependencies must be installed):
+
+    python -m benchmarks.async_load_bench --latency 0.2 --requests 300 --concurrency 32
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.stub_translator import start_stub_translator
+from benchmarks.translation_engine_bench import make_document
+
+# RSS varies by a few pages between runs of the same server
+BUDGET_TOLERANCE = 0.05
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def child_pids(pid):
+    pids = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as children:
+            pids.extend(int(child) for child in children.read().split())
+    return pids
+
+
+def tree_rss_mib(pid):
+    """Resident memory of a process and all its descendants, in MiB."""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f"/proc/{current}/status") as status:
+                total += next(int(line.split()[1]) for line in status if line.startswith('VmRSS:'))
+            pids.extend(child_pids(current))
+        except (FileNotFoundError, StopIteration):
+            continue
+    return total / 1024
+
+
+def start_server(command, port, env):
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/stats", timeout=1)
+            return process
+        except (requests.ConnectionError, requests.Timeout):
+            time.sleep(0.2)  # Not listening yet, or a worker is still importing the app
+    process.kill()
+    raise RuntimeError(f"Server did not start: {' '.join(command)}")
+
+
+def gunicorn_command(workers, port):
+    # -c /dev/null: gunicorn.conf.py would otherwise be picked up from the working directory
+    return [sys.executable, '-m', 'gunicorn', '-c', '/dev/null', '-w', str(workers), '-b', f"127.0.0.1:{port}",
+            '--timeout', '300', 'benchmarks.offline_app:app']
+
+
+def post_translation(url, text):
+    start = time.perf_counter()
+    response = requests.post(url, data={'text': text, 'language': 'fr', 'source_language': 'en'}, timeout=120)
+    return time.perf_counter() - start, response.status_code == 200
+
+
+def load(port, total, concurrency, text, tag):
+    url = f"http://127.0.0.1:{port}/translate_and_insert"
+    # A unique prefix per request keeps the translation memory from answering instead of the stub
+    texts = [f"Request {tag}-{i}. {text}" for i in range(total)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda t: post_translation(url, t), texts))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        'rps': total / elapsed,
+        'p50': statistics.median(latencies),
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'errors': sum(1 for _, ok in results if not ok),
+    }
+
+
+def report(name, workers, rss, result):
+    print(f"{name:<6} workers={workers:<3} rss={rss:6.1f} MiB  req/s={result['rps']:7.1f}  "
+          f"p50={result['p50']:.3f}s  p99={result['p99']:.3f}s  errors={result['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.2, help="Simulated Translator round trip, in seconds")
+    parser.add_argument('--requests', type=int, default=300, help="Requests per server")
+    parser.add_argument('--concurrency', type=int, default=32, help="Concurrent clients")
+    parser.add_argument('--paragraphs', type=int, default=3, help="Paragraphs of text per request")
+    parser.add_argument('--budget-mib', type=float, help="Memory budget; defaults to the async server's RSS")
+    args = parser.parse_args()
+
+    stub = start_stub_translator(args.latency)
+    workdir = tempfile.mkdtemp(prefix='async-load-bench-')
+
+    def server_env(name):
+        # A fresh work directory per server, so neither starts with the other's memory or queues
+        return dict(os.environ, BENCH_WORKDIR=os.path.join(workdir, name), AZURE_TRANSLATION_ENDPOINT=stub.endpoint)
+
+    text = make_document(args.paragraphs)
+    warmup = max(1, args.concurrency // 4)
+
+    port = free_port()
+    server = start_server([sys.executable, '-m', 'uvicorn', 'benchmarks.offline_app:application',
+                           '--port', str(port), '--log-level', 'warning'], port, server_env('async'))
+    try:
+        load(port, warmup, warmup, text, 'warm-async')
+        async_rss = tree_rss_mib(server.pid)
+        async_result = load(port, args.requests, args.concurrency, text, 'async')
+    finally:
+        server.terminate()
+        server.wait()
+
+    # Size the sync worker count from a one-worker gunicorn: master + worker must fit the budget
+    port = free_port()
+    probe = start_server(gunicorn_command(1, port), port, server_env('probe'))
+    try:
+        load(port, 1, 1, text, 'probe')
+        probe_rss = tree_rss_mib(probe.pid)
+        master_rss = probe_rss - sum(tree_rss_mib(child) for child in child_pids(probe.pid))
+    finally:
+        probe.terminate()
+        probe.wait()
+    budget = args.budget_mib or max(async_rss, probe_rss)
+    workers = int((budget - master_rss) // (probe_rss - master_rss))
+    if workers < 1:
+        raise SystemExit(f"A budget of {budget:.1f} MiB does not fit one sync worker: gunicorn needs "
+                         f"{probe_rss:.1f} MiB for the master and one worker.")
+
+    port = free_port()
+    server = start_server(gunicorn_command(workers, port), port, server_env('sync'))
+    try:
+        load(port, warmup, warmup, text, 'warm-sync')
+        sync_rss = tree_rss_mib(server.pid)
+        sync_result = load(port, args.requests, args.concurrency, text, 'sync')
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"Budget {budget:.1f} MiB, Translator latency {args.latency}s, {args.concurrency} concurrent clients")
+    report('sync', workers, sync_rss, sync_result)
+    report('async', 1, async_rss, async_result)
+    over_budget = [name for name, rss in (('sync', sync_rss), ('async', async_rss)) if rss > budget * (1 + BUDGET_TOLERANCE)]
+    if over_budget:
+        raise SystemExit(f"Over the {budget:.1f} MiB budget: {', '.join(over_budget)}; "
+                         f"the comparison is not at a fixed memory budget.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Compare the old temp-file + docx2txt DOCX extraction with the streaming in-memory extractor.
+
+Run from the repository root:
+
+    python -m benchmarks.docx_extraction_bench --paragraphs 1000 10000 50000
+
+docx2txt is only needed for the legacy column (pip install docx2txt).
+"""
+import argparse
+import io
+import tempfile
+import time
+import tracemalloc
+
+import docx
+import fitz  # PyMuPDF
+
+import extraction
+from benchmarks.translation_engine_bench import make_document
+
+
+def make_docx(paragraphs):
+    """A DOCX with the given number of paragraphs, a table and an embedded image."""
+    document = docx.Document()
+    for paragraph in make_document(paragraphs).split('\n\n'):
+        document.add_paragraph(paragraph)
+    table = document.add_table(rows=2, cols=2)
+    table.cell(0, 0).text = 'Cell text.'
+    # A blank PNG is enough to put a media part in the package
+    image = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 256, 256), False)
+    image.clear_with(255)
+    document.add_picture(io.BytesIO(image.tobytes('png')))
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def legacy_extract(stream):
+    """The pre-streaming behaviour: copy the upload to a temp file (never deleted) and run docx2txt on it."""
+    import docx2txt
+    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
+        stream.seek(0)
+        tmp_file.write(stream.read())
+        return docx2txt.process(tmp_file.name)
+
+
+def iterate_paragraphs(stream):
+    """What the translate routes do: consume paragraphs one by one without building the whole text."""
+    return sum(len(paragraph) for paragraph in extraction.iter_docx_paragraphs(stream))
+
+
+def measure(func, data):
+    stream = io.BytesIO(data)
+    tracemalloc.start()
+    start = time.perf_counter()
+    text = func(stream)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return text, elapsed, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--paragraphs', type=int, nargs='+', default=[1000, 10000, 50000])
+    args = parser.parse_args()
+
+    for paragraphs in args.paragraphs:
+        data = make_docx(paragraphs)
+        print(f"DOCX: {paragraphs} paragraphs, {len(data) / 1024:.0f} KiB")
+        streaming_text, elapsed, peak = measure(extraction.extract_text_from_docx, data)
+        try:
+            legacy_text, legacy_elapsed, legacy_peak = measure(legacy_extract, data)
+        except ImportError:
+            print("  legacy     skipped (docx2txt not installed)")
+            print(f"  streaming  time={elapsed:.3f}s peak_alloc={peak:6.1f} MiB")
+        else:
+            same = ' '.join(legacy_text.split()) == ' '.join(streaming_text.split())
+            print(f"  legacy     time={legacy_elapsed:.3f}s peak_alloc={legacy_peak:6.1f} MiB")
+            print(f"  streaming  time={elapsed:.3f}s peak_alloc={peak:6.1f} MiB  same_text={same}")
+        _, elapsed, peak = measure(iterate_paragraphs, data)
+        print(f"  iterated   time={elapsed:.3f}s peak_alloc={peak:6.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
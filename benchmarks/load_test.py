@@ -0,0 +1,229 @@
+"""Load-test the offline app with a weighted mix of endpoints; reports throughput and p50/p99 per endpoint.
+
+The app runs in gunicorn or uvicorn against the stub Translator and the local stand-ins
+(benchmarks.offline_app), so no Azure resources are used. Clients run a closed loop for the
+given duration, each picking scenarios from the mix with its own seeded RNG, so a run with the
+same arguments sends the same sequence of requests.
+
+Run from the repository root (the app's dependencies must be installed):
+
+    python -m benchmarks.load_test --server gunicorn --workers 4 --threads 4 --duration 30 --concurrency 16
+    python -m benchmarks.load_test --server uvicorn --mix translate_text=6 stream=2 speech=1 --throttle-rate 0.02
+"""
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.async_load_bench import free_port, start_server, tree_rss_mib
+from benchmarks.docx_extraction_bench import make_docx
+from benchmarks.pdf_extraction_bench import make_pdf
+from benchmarks.stub_translator import start_stub_translator
+from benchmarks.translation_engine_bench import make_document
+
+DEFAULT_MIX = {'translate_text': 5, 'stream': 2, 'translate_pdf': 1, 'translate_docx': 1, 'document': 1,
+               'speech': 1, 'feedback': 1, 'stats': 1}
+TIMEOUT_SECONDS = 300
+
+
+class Corpus:
+    """Request bodies shared by every client: a text template, a small PDF and a small DOCX."""
+
+    def __init__(self, workdir, paragraphs):
+        self.text = make_document(paragraphs)
+        pdf_path = os.path.join(workdir, 'load.pdf')
+        make_pdf(pdf_path, 4)
+        with open(pdf_path, 'rb') as pdf_file:
+            self.pdf = pdf_file.read()
+        self.docx = make_docx(40)
+
+
+# Each scenario makes one logical request (following up to completion where it streams) and returns success.
+
+def translate_text(session, base_url, corpus, tag):
+    # A unique prefix keeps the translation memory from answering instead of the Translator
+    response = session.post(f"{base_url}/translate_and_insert", timeout=TIMEOUT_SECONDS,
+                            data={'text': f"Request {tag}. {corpus.text}", 'language': 'fr'})
+    return response.status_code == 200
+
+
+def translate_pdf(session, base_url, corpus, tag):
+    response = session.post(f"{base_url}/translate_and_insert", timeout=TIMEOUT_SECONDS,
+                            data={'language': 'fr'}, files={'file': ('load.pdf', io.BytesIO(corpus.pdf))})
+    return response.status_code == 200
+
+
+def translate_docx(session, base_url, corpus, tag):
+    response = session.post(f"{base_url}/translate_and_insert", timeout=TIMEOUT_SECONDS,
+                            data={'language': 'fr'}, files={'file': ('load.docx', io.BytesIO(corpus.docx))})
+    return response.status_code == 200
+
+
+def stream(session, base_url, corpus, tag):
+    response = session.post(f"{base_url}/translate_stream", timeout=TIMEOUT_SECONDS,
+                            data={'text': f"Request {tag}. {corpus.text}", 'language': 'fr'})
+    return response.status_code == 200 and 'event: done' in response.text
+
+
+def document(session, base_url, corpus, tag):
+    response = session.post(f"{base_url}/translate_document", timeout=TIMEOUT_SECONDS,
+                            data={'language': 'fr'}, files={'file': ('load.docx', io.BytesIO(corpus.docx))})
+    return response.status_code == 200 and len(response.content) > 0
+
+
+def speech(session, base_url, corpus, tag):
+    response = session.post(f"{base_url}/synthesize_speech", timeout=TIMEOUT_SECONDS,
+                            json={'text': f"Request {tag}. {corpus.text[:500]}", 'language': 'en'})
+    if response.status_code != 200:
+        return False
+    audio = session.get(f"{base_url}/audio/{response.json()['filename']}", timeout=TIMEOUT_SECONDS)
+    return audio.status_code == 200 and len(audio.content) > 0
+
+
+def feedback(session, base_url, corpus, tag):
+    response = session.post(f"{base_url}/submit_feedback", json={'feedback': f"Load test {tag}"},
+                            timeout=TIMEOUT_SECONDS)
+    return response.status_code == 200
+
+
+def stats(session, base_url, corpus, tag):
+    return session.get(f"{base_url}/stats", timeout=TIMEOUT_SECONDS).status_code == 200
+
+
+SCENARIOS = {scenario.__name__: scenario for scenario in
+             (translate_text, translate_pdf, translate_docx, stream, document, speech, feedback, stats)}
+
+
+def parse_mix(items):
+    if not items:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for item in items:
+        name, _, weight = item.partition('=')
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario '{name}'; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def client_loop(number, base_url, corpus, mix, deadline, seed, results, lock):
+    rng = random.Random(seed + number)
+    names, weights = list(mix), list(mix.values())
+    session = requests.Session()
+    count = 0
+    while time.monotonic() < deadline:
+        name = rng.choices(names, weights)[0]
+        tag = f"{seed}-{number}-{count}"
+        count += 1
+        start = time.perf_counter()
+        try:
+            ok = SCENARIOS[name](session, base_url, corpus, tag)
+        except requests.RequestException:
+            ok = False
+        with lock:
+            results.append((name, time.perf_counter() - start, ok))
+
+
+def percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))]
+
+
+def summarize(results, elapsed):
+    """Per-scenario and overall request counts, errors, throughput and latency percentiles."""
+    summary = {}
+    for name in sorted({name for name, _, _ in results}) + ['all']:
+        selected = [(latency, ok) for scenario, latency, ok in results if name in ('all', scenario)]
+        latencies = sorted(latency for latency, _ in selected)
+        summary[name] = {
+            'requests': len(selected),
+            'errors': sum(1 for _, ok in selected if not ok),
+            'rps': len(selected) / elapsed,
+            'p50': statistics.median(latencies),
+            'p99': percentile(latencies, 0.99),
+        }
+    return summary
+
+
+def server_command(args, port):
+    if args.server == 'uvicorn':
+        return [sys.executable, '-m', 'uvicorn', 'benchmarks.offline_app:application', '--port', str(port),
+                '--workers', str(args.workers), '--log-level', 'warning']
+    return [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '--threads', str(args.threads),
+            '-b', f"127.0.0.1:{port}", '--timeout', str(TIMEOUT_SECONDS), 'benchmarks.offline_app:app']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=('gunicorn', 'uvicorn'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help="Server worker processes")
+    parser.add_argument('--threads', type=int, default=4, help="Threads per gunicorn worker")
+    parser.add_argument('--concurrency', type=int, default=8, help="Concurrent clients")
+    parser.add_argument('--duration', type=float, default=20, help="Seconds of load after warm-up")
+    parser.add_argument('--mix', nargs='+', help="Scenario weights as name=weight (default: " + ' '.join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()) + ")")
+    parser.add_argument('--paragraphs', type=int, default=3, help="Paragraphs of text per text request")
+    parser.add_argument('--latency', type=float, default=0.1, help="Stub Translator round trip, in seconds")
+    parser.add_argument('--jitter', type=float, default=0.05, help="Extra random Translator latency, up to this")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Share of Translator requests answered 429")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    stub = start_stub_translator(args.latency, jitter=args.jitter, throttle_rate=args.throttle_rate, seed=args.seed)
+    workdir = tempfile.mkdtemp(prefix='load-test-')
+    corpus = Corpus(workdir, args.paragraphs)
+    env = dict(os.environ, BENCH_WORKDIR=workdir, AZURE_TRANSLATION_ENDPOINT=stub.endpoint)
+    port = free_port()
+    server = start_server(server_command(args, port), port, env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        # One request per scenario first, so worker start-up and first-use costs are not measured
+        session = requests.Session()
+        for name in mix:
+            SCENARIOS[name](session, base_url, corpus, f"warmup-{name}")
+        translator_requests, throttled = stub.request_count, stub.throttled_count
+
+        results = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + args.duration
+        start = time.perf_counter()
+        clients = [threading.Thread(target=client_loop, args=(number, base_url, corpus, mix, deadline, args.seed,
+                                                              results, lock))
+                   for number in range(args.concurrency)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+        rss = tree_rss_mib(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    if not results:
+        raise SystemExit("No requests completed; increase --duration.")
+    summary = summarize(results, elapsed)
+    print(f"{args.server} workers={args.workers}" + (f" threads={args.threads}" if args.server == 'gunicorn' else '') +
+          f", {args.concurrency} clients for {elapsed:.1f}s, server RSS {rss:.1f} MiB")
+    print(f"Translator: {stub.request_count - translator_requests} requests, "
+          f"{stub.throttled_count - throttled} throttled (latency {args.latency}s + up to {args.jitter}s)")
+    print(f"{'endpoint':<16} {'requests':>8} {'errors':>7} {'req/s':>8} {'p50':>8} {'p99':>8}")
+    for name, row in summary.items():
+        print(f"{name:<16} {row['requests']:>8} {row['errors']:>7} {row['rps']:8.2f} "
+              f"{row['p50']:7.3f}s {row['p99']:7.3f}s")
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({'arguments': vars(args), 'elapsed': elapsed, 'server_rss_mib': rss, 'endpoints': summary},
+                      output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Fixed-corpus micro-benchmarks of the app's hot paths, run offline against the local stand-ins.
+
+Every case works on the same generated corpus on every run, so results are comparable across
+commits. Translation memory is cleared before each cold run; warm runs repeat a cached input.
+
+Run from the repository root (the app's dependencies must be installed):
+
+    python -m benchmarks.micro_bench --latency 0.05 --repeat 5
+    python -m benchmarks.micro_bench --only translate_text_cold pdf_extract
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks import offline_app
+from benchmarks.docx_extraction_bench import make_docx
+from benchmarks.pdf_extraction_bench import make_pdf
+from benchmarks.stub_translator import start_stub_translator
+from benchmarks.translation_engine_bench import make_document
+
+import extraction
+from translation_memory import get_translation_memory
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'LaurenConvery-Translation'))
+import LaurenConvery_HighlightedTranslation as highlighted_script
+import LaurenConvery_Translationapp as columns_script
+
+SCRIPT_TARGET = 'pt-BR'
+
+
+def corpus_sentences(count, seed=1):
+    return make_document(count // 4 + 1, seed).replace('\n\n', ' ').split('. ')
+
+
+def make_columns_workbook(path, rows):
+    """A test-script workbook with the default translated columns; steps repeat, as in the real ones."""
+    import pandas as pd
+    sentences = corpus_sentences(rows)
+    data = {'Test Case ID': [f"TC-{row:05d}" for row in range(rows)]}
+    for i, column in enumerate(columns_script.DEFAULT_COLUMNS, 1):
+        data[column] = [sentences[(row * i) % len(sentences)] for row in range(rows)]
+    pd.DataFrame(data).to_excel(path, index=False)
+
+
+def make_highlighted_workbook(path, rows, columns=12):
+    """A workbook where every third string cell is highlighted."""
+    import openpyxl
+    from openpyxl.styles import PatternFill
+    sentences = corpus_sentences(rows)
+    fill = PatternFill(start_color='FFFFFF00', end_color='FFFFFF00', fill_type='solid')
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in range(1, rows + 1):
+        for column in range(1, columns + 1):
+            cell = ws.cell(row=row, column=column, value=sentences[(row * column) % len(sentences)])
+            if (row + column) % 3 == 0:
+                cell.fill = fill
+    wb.save(path)
+
+
+def quietly(func, *args):
+    """Run one of the Excel scripts without its progress output."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def build_cases(args, workdir):
+    """(name, setup, run) triples; setup runs untimed before every repetition."""
+    document = make_document(args.paragraphs)
+    pdf_path = os.path.join(workdir, 'corpus.pdf')
+    make_pdf(pdf_path, args.pages)
+    docx_data = make_docx(args.docx_paragraphs)
+    columns_path = os.path.join(workdir, 'columns.xlsx')
+    make_columns_workbook(columns_path, args.rows)
+    highlighted_path = os.path.join(workdir, 'highlighted.xlsx')
+    make_highlighted_workbook(highlighted_path, args.rows)
+    translate_text = offline_app.app_module.translate_text
+
+    def cold():
+        get_translation_memory().invalidate()
+
+    def warm():
+        translate_text(document, 'fr', 'en')
+
+    def extract_pdf():
+        with open(pdf_path, 'rb') as pdf_file:
+            return extraction.extract_text_from_pdf(pdf_file)
+
+    return [
+        ('translate_text_cold', cold, lambda: translate_text(document, 'fr', 'en')),
+        ('translate_text_warm', warm, lambda: translate_text(document, 'fr', 'en')),
+        ('pdf_extract', None, extract_pdf),
+        ('docx_extract', None, lambda: extraction.extract_text_from_docx(io.BytesIO(docx_data))),
+        ('excel_columns', cold, lambda: quietly(columns_script.translate_excel_columns, columns_path,
+                                                columns_script.DEFAULT_COLUMNS, SCRIPT_TARGET,
+                                                os.path.join(workdir, 'columns_out.xlsx'))),
+        ('excel_highlighted_load', cold, lambda: quietly(highlighted_script.translate_highlighted_cells,
+                                                         highlighted_path, [SCRIPT_TARGET],
+                                                         os.path.join(workdir, 'highlighted_out.xlsx'), 'load')),
+        ('excel_highlighted_stream', cold, lambda: quietly(highlighted_script.translate_highlighted_cells,
+                                                           highlighted_path, [SCRIPT_TARGET],
+                                                           os.path.join(workdir, 'highlighted_out.xlsx'), 'stream')),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.05, help="Stub Translator round trip, in seconds")
+    parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case")
+    parser.add_argument('--warmup', type=int, default=1, help="Untimed runs per case first (worker pools, imports)")
+    parser.add_argument('--paragraphs', type=int, default=200, help="Paragraphs in the translate_text document")
+    parser.add_argument('--pages', type=int, default=100, help="Pages in the PDF")
+    parser.add_argument('--docx-paragraphs', type=int, default=5000, help="Paragraphs in the DOCX")
+    parser.add_argument('--rows', type=int, default=2000, help="Rows in each Excel workbook")
+    parser.add_argument('--only', nargs='+', help="Run only these cases")
+    args = parser.parse_args()
+
+    stub = start_stub_translator(args.latency)
+    os.environ['AZURE_TRANSLATION_ENDPOINT'] = stub.endpoint
+    workdir = tempfile.mkdtemp(prefix='micro-bench-')
+    print(f"Translator latency {args.latency}s, {args.repeat} runs per case after {args.warmup} warm-up, "
+          f"corpus in {workdir}")
+    print(f"{'case':<26} {'min':>8} {'median':>8} {'max':>8} {'requests':>9}")
+    for name, setup, run in build_cases(args, workdir):
+        if args.only and name not in args.only:
+            continue
+        for _ in range(args.warmup):
+            if setup is not None:
+                setup()
+            run()
+        timings = []
+        requests = 0
+        for _ in range(args.repeat):
+            if setup is not None:
+                setup()
+            requests_before = stub.request_count
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+            requests += stub.request_count - requests_before
+        requests /= args.repeat
+        print(f"{name:<26} {min(timings):7.3f}s {statistics.median(timings):7.3f}s {max(timings):7.3f}s "
+              f"{requests:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""The Flask app and ASGI entry point wired to local stand-ins, for offline benchmarks and load tests.
+
+Translator calls go to the stub server at AZURE_TRANSLATION_ENDPOINT; Speech, Blob Storage and
+SQL use benchmarks.standins. All state (translation memory, SQLite database, blobs, journals,
+jobs) lives in BENCH_WORKDIR, which must be set when several worker processes share it:
+
+    BENCH_WORKDIR=/tmp/bench AZURE_TRANSLATION_ENDPOINT=http://127.0.0.1:5001 gunicorn -w 4 benchmarks.offline_app:app
+    BENCH_WORKDIR=/tmp/bench AZURE_TRANSLATION_ENDPOINT=http://127.0.0.1:5001 uvicorn benchmarks.offline_app:application
+
+or, with a stub Translator started in the same process:
+
+    python -m benchmarks.offline_app --port 5000 --latency 0.1
+"""
+import argparse
+import os
+import tempfile
+
+WORKDIR = os.environ.setdefault('BENCH_WORKDIR', tempfile.mkdtemp(prefix='offline-app-'))
+os.makedirs(WORKDIR, exist_ok=True)
+# The app reads these at import time, so they are set before it is imported.
+OFFLINE_ENVIRONMENT = {
+    'AZURE_TRANSLATION_KEY': 'offline',
+    'AZURE_TRANSLATION_LOCATION': 'offline',
+    'AZURE_TRANSLATION_ENDPOINT': 'http://127.0.0.1:5001',
+    'AZURE_SPEECH_KEY': 'offline',
+    'AZURE_SPEECH_REGION': 'offline',
+    'TRANSLATION_MEMORY_PATH': os.path.join(WORKDIR, 'translation_memory.sqlite3'),
+    'RATE_LIMIT_STATE_PATH': os.path.join(WORKDIR, 'rate_limits.sqlite3'),
+    'WRITE_BEHIND_JOURNAL_DIR': os.path.join(WORKDIR, 'journal'),
+    'JOBS_DIR': os.path.join(WORKDIR, 'jobs'),
+    'APP_LOG_PATH': os.path.join(WORKDIR, 'app.log'),
+    # No quota unless the benchmark asks for one
+    'TRANSLATOR_CHARS_PER_MINUTE': '0',
+    'SPEECH_CHARS_PER_MINUTE': '0',
+}
+for name, value in OFFLINE_ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
+
+import app as app_module
+import asgi
+from benchmarks import standins
+
+# Synthesized (silent) audio is written here instead of the repository's audio_files/
+app_module.audio_files_directory = os.path.join(WORKDIR, 'audio_files')
+standins.install(WORKDIR, float(os.environ.get('BENCH_SPEECH_LATENCY', 0.2)),
+                 float(os.environ.get('BENCH_SPEECH_CHARS_PER_SECOND', 400)))
+
+app = app_module.create_app()
+application = asgi.application
+
+
+def main():
+    from benchmarks.stub_translator import start_stub_translator
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.05, help="Stub Translator round trip, in seconds")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Share of Translator requests answered with 429")
+    args = parser.parse_args()
+    # The Translator client reads its endpoint on first use, so it can still be pointed at the stub here
+    stub = start_stub_translator(args.latency, throttle_rate=args.throttle_rate)
+    os.environ['AZURE_TRANSLATION_ENDPOINT'] = stub.endpoint
+    print(f"Offline app on http://127.0.0.1:{args.port} (state in {WORKDIR}, stub Translator at {stub.endpoint})")
+    app.run(port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
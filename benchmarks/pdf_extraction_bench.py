@@ -0,0 +1,89 @@
+"""Compare whole-document PDF extraction with the streaming, page-parallel extractor.
+
+Run from the repository root:
+
+    python -m benchmarks.pdf_extraction_bench --pages 300
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+from benchmarks.translation_engine_bench import make_document
+
+
+def make_pdf(path, pages):
+    """Write a text-heavy PDF with one generated paragraph block per page."""
+    text = make_document(pages * 3)
+    paragraphs = text.split('\n\n')
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (36, 36, -36, -36), '\n\n'.join(paragraphs[number * 3:number * 3 + 3]), fontsize=9)
+    doc.save(path)
+
+
+def legacy_extract(pdf_file):
+    """The pre-streaming behaviour: read everything, then concatenate page by page."""
+    text = ""
+    with fitz.open(stream=pdf_file.read(), filetype="pdf") as doc:
+        for page in doc:
+            text += page.get_text()
+    return text
+
+
+def run_mode(mode, path):
+    """Runs in a child process so each mode's peak RSS is measured separately."""
+    import extraction
+
+    with open(path, 'rb') as pdf_file:
+        stream = io.BytesIO(pdf_file.read())
+    if mode == 'streaming':
+        # Start the worker processes first, as a long-running web worker would already have them.
+        list(extraction._get_pool().map(abs, range(extraction.PDF_WORKERS)))
+    start = time.perf_counter()
+    first_page = None
+    if mode == 'legacy':
+        legacy_extract(stream)
+        first_page = time.perf_counter() - start  # Nothing is available before the whole document is done
+    else:
+        for _ in extraction.iter_pdf_pages(stream):
+            if first_page is None:
+                first_page = time.perf_counter() - start
+    total = time.perf_counter() - start
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'mode': mode, 'first_page': first_page, 'total': total, 'peak_rss_mb': peak_rss_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=300, help="Number of pages in the generated PDF")
+    parser.add_argument('--run-mode', help=argparse.SUPPRESS)
+    parser.add_argument('--pdf', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        run_mode(args.run_mode, args.pdf)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'bench.pdf')
+        make_pdf(path, args.pages)
+        print(f"PDF: {args.pages} pages, {os.path.getsize(path) / 1024:.0f} KiB")
+        for mode in ('legacy', 'streaming'):
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.pdf_extraction_bench', '--run-mode', mode,
+                                     '--pdf', path], capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:<10} first_page={result['first_page']:.3f}s total={result['total']:.3f}s "
+                  f"peak_rss={result['peak_rss_mb']:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""Local stand-ins for Azure Speech, Blob Storage and SQL, so the app can be benchmarked offline.
+
+`install()` swaps them into the already imported app modules:
+
+- speech synthesis produces silent MP3-sized chunks at a configurable speed instead of calling Azure;
+- blobs are written under a local directory (unless AZURE_STORAGE_CONNECTION_STRING points at
+  an emulator such as Azurite, in which case the real SDK is used);
+- the pyodbc pool is replaced by SQLite connections with the same cursor interface.
+
+The Translator stand-in is the HTTP server in benchmarks.stub_translator.
+"""
+import asyncio
+import functools
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+
+# 32 kbit/s MP3, the app's output format, at roughly 15 spoken characters per second.
+AUDIO_BYTES_PER_CHAR = 4000 // 15
+AUDIO_CHUNK_BYTES = 4096
+SILENT_CHUNK = b'\xff\xf3' + bytes(AUDIO_CHUNK_BYTES - 2)
+
+SQLITE_MIGRATIONS = [
+    ('TranslatedDocuments', """
+        CREATE TABLE IF NOT EXISTS TranslatedDocuments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            input_text TEXT,
+            detected_language TEXT,
+            translated_text TEXT,
+            output_language TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            blob_url TEXT,
+            user_ip TEXT,
+            document_key TEXT
+        )
+    """),
+    ('TranslationOutputs', """
+        CREATE TABLE IF NOT EXISTS TranslationOutputs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            document_key TEXT NOT NULL,
+            output_language TEXT,
+            translated_text TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """),
+    ('Feedback', """
+        CREATE TABLE IF NOT EXISTS Feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            feedback_text TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """),
+    ('ModelRatings', """
+        CREATE TABLE IF NOT EXISTS ModelRatings (
+            id INTEGER PRIMARY KEY,
+            ratingA INTEGER NOT NULL DEFAULT 0,
+            ratingB INTEGER NOT NULL DEFAULT 0
+        )
+    """),
+    ('ModelRatings', "INSERT OR IGNORE INTO ModelRatings (id) VALUES (1)"),
+]
+
+
+class FakeSpeechResult:
+    def __init__(self, reason):
+        self.reason = reason
+
+
+class FakeSynthesizer:
+    """Drop-in for speech._Synthesizer: waits first_chunk_latency, then emits audio at chars_per_second."""
+
+    def __init__(self, completed_reason, first_chunk_latency=0.2, chars_per_second=400):
+        self.completed_reason = completed_reason
+        self.first_chunk_latency = first_chunk_latency
+        self.chars_per_second = chars_per_second
+
+    def speak(self, text, sink):
+        time.sleep(self.first_chunk_latency)
+        remaining = len(text) * AUDIO_BYTES_PER_CHAR
+        chars_per_chunk = AUDIO_CHUNK_BYTES / AUDIO_BYTES_PER_CHAR
+        while remaining > 0:
+            chunk = SILENT_CHUNK[:remaining]
+            time.sleep(chars_per_chunk / self.chars_per_second)
+            sink(chunk)
+            remaining -= len(chunk)
+        return FakeSpeechResult(self.completed_reason)
+
+
+class FilesystemBlobClient:
+    """The subset of azure.storage.blob.BlobClient that blob_storage uses, backed by a local file."""
+
+    def __init__(self, root, container, blob):
+        self.blob_name = blob
+        self.path = os.path.join(root, container, blob)
+        self.url = f"file://{self.path}"
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def upload_blob(self, data, length=None, overwrite=False, **kwargs):
+        from azure.core.exceptions import ResourceExistsError
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(self.path), delete=False) as tmp_file:
+            if isinstance(data, bytes):
+                tmp_file.write(data)
+            else:
+                shutil.copyfileobj(data, tmp_file)
+        if overwrite:
+            os.replace(tmp_file.name, self.path)
+            return
+        try:
+            # link() fails if the blob exists, like an If-None-Match: * upload
+            os.link(tmp_file.name, self.path)
+        except FileExistsError:
+            raise ResourceExistsError("The specified blob already exists.")
+        finally:
+            os.remove(tmp_file.name)
+
+
+class FilesystemBlobServiceClient:
+    def __init__(self, root):
+        self.root = root
+
+    def get_blob_client(self, container, blob):
+        return FilesystemBlobClient(self.root, container, blob)
+
+
+class AsyncFilesystemBlobClient:
+    """Async counterpart of FilesystemBlobClient for the ASGI path."""
+
+    def __init__(self, root, container, blob):
+        self._client = FilesystemBlobClient(root, container, blob)
+        self.url = self._client.url
+
+    async def exists(self):
+        return await asyncio.get_running_loop().run_in_executor(None, self._client.exists)
+
+    async def upload_blob(self, data, **kwargs):
+        await asyncio.get_running_loop().run_in_executor(None, functools.partial(self._client.upload_blob, data, **kwargs))
+
+
+class AsyncFilesystemBlobServiceClient:
+    def __init__(self, root):
+        self.root = root
+
+    def get_blob_client(self, container, blob):
+        return AsyncFilesystemBlobClient(self.root, container, blob)
+
+    async def close(self):
+        pass
+
+
+class SqliteCursor:
+    """A sqlite3 cursor with the pyodbc conveniences the app relies on (context manager, chained execute)."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        self._cursor.execute(sql, params)
+        return self
+
+    def executemany(self, sql, rows):
+        self._cursor.executemany(sql, rows)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SqliteConnection:
+    def __init__(self, path):
+        # Pooled connections move between threads, and gunicorn workers share the file
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+
+    def cursor(self):
+        return SqliteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def install(workdir, speech_first_chunk_latency=0.2, speech_chars_per_second=400):
+    """Point the imported app modules at the stand-ins, keeping their state under workdir."""
+    import blob_storage
+    import db
+    import speech
+
+    db.MIGRATIONS = SQLITE_MIGRATIONS
+    database_path = os.path.join(workdir, 'app.sqlite3')
+    with db._pool_lock:
+        db._pool = db.ConnectionPool(lambda: SqliteConnection(database_path))
+
+    completed = speech._speechsdk().ResultReason.SynthesizingAudioCompleted
+    speech._Synthesizer = lambda: FakeSynthesizer(completed, speech_first_chunk_latency, speech_chars_per_second)
+
+    if not os.environ.get('AZURE_STORAGE_CONNECTION_STRING'):
+        blob_root = os.path.join(workdir, 'blobs')
+        with blob_storage._client_lock:
+            blob_storage._service_client = FilesystemBlobServiceClient(blob_root)
+        try:
+            import async_pipeline
+        except ImportError:
+            return  # aiohttp is only needed for the ASGI entry point
+        async_pipeline._blob_service_client = AsyncFilesystemBlobServiceClient(blob_root)
+
@@ -0,0 +1,151 @@
+"""Measure import and worker start-up cost: lazy SDK imports and gunicorn preload versus eager imports.
+
+Three measurements, each in fresh processes:
+
+- `import app` in a new interpreter, and `import app` plus every SDK in gunicorn.conf.PRELOAD_MODULES
+  (what each worker paid when the modules imported their SDKs at the top);
+- gunicorn with and without preload_app: time until the first response, the memory of master plus
+  workers once they are up (PSS, so pages the workers share with the master count once), and the
+  time until the server answers again after every worker is killed and respawned;
+- the first /translate_document PDF request a fresh server handles, which pays for any SDK that
+  was not imported up front, next to the median of the requests after it.
+
+Run from the repository root (the app's dependencies must be installed):
+
+    python -m benchmarks.startup_bench --workers 4 --repeat 5
+"""
+import argparse
+import os
+import runpy
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from benchmarks.async_load_bench import child_pids, free_port
+from benchmarks.pdf_extraction_bench import make_pdf
+from benchmarks.stub_translator import start_stub_translator
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRELOAD_MODULES = runpy.run_path(os.path.join(REPOSITORY, 'gunicorn.conf.py'))['PRELOAD_MODULES']
+
+
+def import_seconds(statement, env, repeat):
+    """Median wall time of a fresh interpreter running statement, minus an empty interpreter's."""
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], env=env, cwd=REPOSITORY, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - start
+
+    baseline = statistics.median(run('pass') for _ in range(repeat))
+    return statistics.median(run(statement) for _ in range(repeat)) - baseline
+
+
+def tree_pss_mib(pid):
+    """Proportional set size of a process and its descendants, in MiB."""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f"/proc/{current}/smaps_rollup") as rollup:
+                total += next(int(line.split()[1]) for line in rollup if line.startswith('Pss:'))
+            pids.extend(child_pids(current))
+        except (FileNotFoundError, StopIteration):
+            continue
+    return total / 1024
+
+
+def wait_until_ready(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return
+        except (requests.ConnectionError, requests.Timeout):
+            time.sleep(0.01)
+    process.kill()
+    raise RuntimeError("gunicorn did not start")
+
+
+def translate_pdf(port, pdf_data):
+    start = time.perf_counter()
+    response = requests.post(f"http://127.0.0.1:{port}/translate_document", data={'language': 'fr'},
+                             files={'file': ('startup.pdf', pdf_data)}, timeout=120)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def measure_gunicorn(preload, workers, env, pdf_data, settle, requests_after):
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f"127.0.0.1:{port}",
+                                'app:create_app()'],
+                               env=dict(env, GUNICORN_PRELOAD='true' if preload else 'false'), cwd=REPOSITORY,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(port, process)
+        ready = time.perf_counter() - start
+        # Let the other workers finish booting before their memory is counted
+        time.sleep(settle)
+        pss = tree_pss_mib(process.pid)
+        first = translate_pdf(port, pdf_data)
+        after = statistics.median(translate_pdf(port, pdf_data) for _ in range(requests_after))
+
+        # As after a crash or max_requests recycling: the master boots replacements for every worker
+        workers_before = set(child_pids(process.pid))
+        start = time.perf_counter()
+        for pid in workers_before:
+            os.kill(pid, signal.SIGKILL)
+        while not set(child_pids(process.pid)) - workers_before:
+            time.sleep(0.001)
+        wait_until_ready(port, process)
+        respawn = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+    return ready, pss, first, after, respawn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per import measurement")
+    parser.add_argument('--settle', type=float, default=3, help="Seconds to wait for all workers before PSS")
+    parser.add_argument('--requests-after', type=int, default=5, help="PDF requests timed after the first one")
+    parser.add_argument('--latency', type=float, default=0.02, help="Stub Translator round trip, in seconds")
+    args = parser.parse_args()
+
+    stub = start_stub_translator(args.latency)
+    workdir = tempfile.mkdtemp(prefix='startup-bench-')
+    env = dict(os.environ, AZURE_TRANSLATION_KEY='bench', AZURE_TRANSLATION_LOCATION='bench',
+               AZURE_TRANSLATION_ENDPOINT=stub.endpoint,
+               TRANSLATION_MEMORY_PATH=os.path.join(workdir, 'memory.sqlite3'),
+               RATE_LIMIT_STATE_PATH=os.path.join(workdir, 'rate_limits.sqlite3'),
+               TRANSLATOR_CHARS_PER_MINUTE='0', JOBS_DIR=os.path.join(workdir, 'jobs'),
+               APP_LOG_PATH=os.path.join(workdir, 'app.log'))
+    pdf_path = os.path.join(workdir, 'startup.pdf')
+    make_pdf(pdf_path, 2)
+    with open(pdf_path, 'rb') as pdf_file:
+        pdf_data = pdf_file.read()
+
+    lazy = import_seconds('import app', env, args.repeat)
+    eager = import_seconds('import app, ' + ', '.join(PRELOAD_MODULES), env, args.repeat)
+    print(f"import app: {lazy:.3f}s lazy, {eager:.3f}s with every SDK imported ({args.repeat} runs, median)")
+
+    print(f"gunicorn, {args.workers} workers")
+    print(f"{'preload':<8} {'ready':>8} {'PSS':>10} {'first PDF':>10} {'later PDF':>10} {'respawn':>8}")
+    for preload in (False, True):
+        ready, pss, first, after, respawn = measure_gunicorn(preload, args.workers, env, pdf_data, args.settle,
+                                                             args.requests_after)
+        print(f"{'on' if preload else 'off':<8} {ready:7.3f}s {pss:6.1f} MiB {first:9.3f}s {after:9.3f}s "
+              f"{respawn:7.3f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Local stand-in for the Azure Translator REST API, used by the benchmarks.
+
+It can also run on its own, for pointing a local app at it:
+
+    python -m benchmarks.stub_translator --port 5001 --latency 0.1 --throttle-rate 0.05
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubTranslatorHandler(BaseHTTPRequestHandler):
+    """Answers /detect and /translate with canned results after a delay, throttling a share of requests."""
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'[]')
+        path = urlparse(self.path).path
+        params = parse_qs(urlparse(self.path).query)
+        with server.lock:
+            server.request_count += 1
+            throttled = server.rng.random() < server.throttle_rate
+            delay = server.latency + server.rng.uniform(0, server.jitter)
+            if throttled:
+                server.throttled_count += 1
+            else:
+                server.char_count += sum(len(item['text']) for item in body)
+        time.sleep(delay)
+
+        if throttled:
+            data = json.dumps({'error': {'code': 429001, 'message': 'The server rejected the request because '
+                                                                    'the client has exceeded request limits.'}})
+            self._send(429, data.encode('utf-8'), {'Retry-After': str(server.retry_after)})
+            return
+        if path == '/detect':
+            payload = [{'language': 'en', 'score': 1.0} for _ in body]
+        elif path == '/translate':
+            targets = params.get('to', ['xx'])
+            payload = [
+                {'detectedLanguage': {'language': 'en', 'score': 1.0},
+                 'translations': [{'text': f"[{to}] {item['text']}", 'to': to} for to in targets]}
+                for item in body
+            ]
+        else:
+            self.send_error(404)
+            return
+        self._send(200, json.dumps(payload).encode('utf-8'))
+
+    def _send(self, status, data, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_translator(latency=0.05, port=0, jitter=0.0, throttle_rate=0.0, retry_after=1, seed=1):
+    """Start the stub server on a background thread and return it; its URL is server.endpoint.
+
+    Each request waits latency plus up to jitter seconds. A throttle_rate share of requests is
+    answered with 429 and Retry-After: retry_after, chosen by a seeded RNG so runs are repeatable.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubTranslatorHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.throttle_rate = throttle_rate
+    server.retry_after = retry_after
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.request_count = 0
+    server.throttled_count = 0
+    server.char_count = 0
+    server.endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--latency', type=float, default=0.05, help="Round-trip time per request, in seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra random latency of up to this many seconds")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with each 429")
+    args = parser.parse_args()
+    server = start_stub_translator(args.latency, args.port, args.jitter, args.throttle_rate, args.retry_after)
+    print(f"Stub Translator listening on {server.endpoint} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(f"{server.request_count} requests, {server.throttled_count} throttled, {server.char_count} characters")
+
+
+if __name__ == '__main__':
+    main()
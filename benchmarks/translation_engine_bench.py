@@ -0,0 +1,73 @@
+"""Compare the old fixed 5000-character chunk loop with the batched translation engine.
+
+Run from the repository root:
+
+    python -m benchmarks.translation_engine_bench --latency 0.05 --paragraphs 400
+"""
+import argparse
+import random
+import time
+
+from benchmarks.stub_translator import start_stub_translator
+from translation_engine import split_segments, translate_segments
+from translator_client import TranslatorClient
+
+WORDS = ("the contract shall be governed by applicable law and each party agrees to the terms "
+         "set out in this agreement including payment delivery warranty and liability clauses").split()
+
+
+def make_document(paragraphs, seed=1):
+    """Build a deterministic multi-paragraph document of plain English-looking sentences."""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(8, 25))]
+            sentences.append(' '.join(words).capitalize() + '.')
+        out.append(' '.join(sentences))
+    return '\n\n'.join(out)
+
+
+def legacy_translate(text, client):
+    """The pre-engine behaviour: one serial request per fixed 5000-character slice."""
+    chunk_size = 5000
+    chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
+    translated = []
+    for chunk in chunks:
+        params = {'api-version': '3.0', 'from': 'en', 'to': ['fr']}
+        response = client.session.post(client.endpoint + '/translate', params=params, json=[{'text': chunk}])
+        translated.append(response.json()[0]['translations'][0]['text'])
+    return ''.join(translated)
+
+
+def engine_translate(text, client):
+    translated_segments, _ = translate_segments(split_segments(text), 'fr', client, source_language='en')
+    return ''.join(translated_segments)
+
+
+def run(name, func, server, text):
+    client = TranslatorClient(key='', endpoint=server.endpoint, location='')
+    before = server.request_count
+    start = time.perf_counter()
+    func(text, client)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<10} requests/doc={server.request_count - before:<5} wall={elapsed:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.05, help="Simulated round-trip time per request, in seconds")
+    parser.add_argument('--paragraphs', type=int, default=400, help="Number of paragraphs in the generated document")
+    args = parser.parse_args()
+
+    server = start_stub_translator(latency=args.latency)
+    text = make_document(args.paragraphs)
+    print(f"Document: {len(text)} characters, stub latency {args.latency * 1000:.0f} ms")
+    run('legacy', legacy_translate, server, text)
+    run('engine', engine_translate, server, text)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Azure Blob Storage uploads of user documents.
+
+Blobs are named after the SHA-256 of their content, so uploading the same file again is skipped
+and two different files can never overwrite each other. The upload is spooled to a temporary
+file while it is hashed, which fixes the blob URL straight away; the transfer itself runs on a
+background thread, in parallel blocks for large files.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CONTAINER_NAME = 'ai-translation'
+UPLOAD_WORKERS = int(os.environ.get('BLOB_UPLOAD_WORKERS', 4))
+# Parallel block uploads per file; files above MAX_SINGLE_PUT_BYTES are sent in MAX_BLOCK_BYTES blocks.
+UPLOAD_CONCURRENCY = int(os.environ.get('BLOB_UPLOAD_CONCURRENCY', 4))
+MAX_SINGLE_PUT_BYTES = 8 * 1024 * 1024
+MAX_BLOCK_BYTES = 4 * 1024 * 1024
+COPY_BUFFER_BYTES = 1024 * 1024
+# Blob names this process has seen uploaded, so repeats skip the existence check.
+KNOWN_BLOBS_MAX = 10000
+
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix='blob-upload')
+_service_client = None
+_client_lock = threading.Lock()
+_known_blobs = set()
+_lock = threading.Lock()
+_counters = {'uploads': 0, 'skipped_existing': 0, 'failures': 0, 'bytes_uploaded': 0}
+
+
+def get_blob_service_client():
+    """Return the process-wide BlobServiceClient, created on first use."""
+    global _service_client
+    with _client_lock:
+        if _service_client is None:
+            # The storage SDK is slow to import, so it is loaded with the first upload
+            from azure.storage.blob import BlobServiceClient
+            _service_client = BlobServiceClient.from_connection_string(
+                os.environ.get('AZURE_STORAGE_CONNECTION_STRING'),
+                max_single_put_size=MAX_SINGLE_PUT_BYTES, max_block_size=MAX_BLOCK_BYTES)
+        return _service_client
+
+
+def blob_name(digest, file_name):
+    return f"{digest}{os.path.splitext(file_name)[1].lower()}"
+
+
+def content_settings(file_name):
+    # Downloads keep the user's file name even though the blob is named by its hash.
+    from azure.storage.blob import ContentSettings
+    return ContentSettings(content_disposition=f'attachment; filename="{os.path.basename(file_name)}"')
+
+
+def spool_and_hash(file_stream):
+    """Copy the stream to a temporary file and return (path, sha256 hex digest, size)."""
+    digest = hashlib.sha256()
+    size = 0
+    file_stream.seek(0)
+    with tempfile.NamedTemporaryFile(prefix='blob-', delete=False) as tmp_file:
+        while True:
+            chunk = file_stream.read(COPY_BUFFER_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            tmp_file.write(chunk)
+            size += len(chunk)
+    file_stream.seek(0)  # Extraction reads the same upload afterwards
+    return tmp_file.name, digest.hexdigest(), size
+
+
+def submit_upload(file_stream, file_name):
+    """Start uploading a document in the background and return (blob URL, future).
+
+    The future resolves to the URL once the blob exists, or raises if the upload failed.
+    """
+    path, digest, size = spool_and_hash(file_stream)
+    blob_client = get_blob_service_client().get_blob_client(container=CONTAINER_NAME, blob=blob_name(digest, file_name))
+    return blob_client.url, _executor.submit(_upload, blob_client, path, size, file_name)
+
+
+def upload_file(file_stream, file_name):
+    """Upload a document and wait for it; returns the blob URL."""
+    _, future = submit_upload(file_stream, file_name)
+    return future.result()
+
+
+def _upload(blob_client, path, size, file_name):
+    from azure.core.exceptions import ResourceExistsError
+    try:
+        if blob_client.blob_name in _known_blobs or blob_client.exists():
+            _count('skipped_existing')
+            return blob_client.url
+        with open(path, 'rb') as data, metrics.span('blob_upload'):
+            # overwrite=False makes a concurrent upload of the same file fail with ResourceExistsError
+            blob_client.upload_blob(data, length=size, overwrite=False, max_concurrency=UPLOAD_CONCURRENCY,
+                                    content_settings=content_settings(file_name))
+        _count('uploads')
+        _count('bytes_uploaded', size)
+    except ResourceExistsError:
+        _count('skipped_existing')
+    except Exception as e:
+        _count('failures')
+        logger.error(f"Failed to upload '{file_name}' to blob storage: {e}")
+        raise
+    finally:
+        os.remove(path)
+    with _lock:
+        if len(_known_blobs) >= KNOWN_BLOBS_MAX:
+            _known_blobs.clear()
+        _known_blobs.add(blob_client.blob_name)
+    logger.info(f"Uploaded '{file_name}' to {blob_client.url}")
+    return blob_client.url
+
+
+def _count(name, amount=1):
+    with _lock:
+        _counters[name] += amount
+
+
+def stats():
+    with _lock:
+        return dict(_counters)
@@ -0,0 +1,340 @@
+"""Azure SQL access: a bounded, health-checked pyodbc connection pool and one-time schema setup.
+
+Run the schema migration at deploy time with:
+
+    flask --app app migrate-db
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import metrics
+from write_behind import WriteBehindQueue
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+POOL_TIMEOUT_SECONDS = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+# Connections idle for longer than this are pinged before being handed out.
+HEALTH_CHECK_AFTER_SECONDS = float(os.environ.get('DB_HEALTH_CHECK_AFTER', 60))
+CONNECTION_TIMEOUT_SECONDS = int(os.environ.get('DB_CONNECTION_TIMEOUT', 30))
+
+TRANSLATED_DOCUMENTS_DDL = """
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'TranslatedDocuments')
+BEGIN
+    CREATE TABLE TranslatedDocuments (
+        id INT PRIMARY KEY IDENTITY(1,1),
+        input_text NVARCHAR(MAX),
+        detected_language NVARCHAR(100),
+        translated_text NVARCHAR(MAX),
+        output_language NVARCHAR(100),
+        created_at DATETIME2 DEFAULT GETDATE(),
+        blob_url NVARCHAR(MAX),
+        user_ip NVARCHAR(100),
+        document_key NVARCHAR(36)
+    )
+END
+ELSE
+BEGIN
+    IF NOT EXISTS (SELECT * FROM sys.columns
+                   WHERE Name = N'created_at' AND Object_ID = Object_ID(N'TranslatedDocuments'))
+    BEGIN
+        ALTER TABLE TranslatedDocuments ADD created_at DATETIME2 DEFAULT GETDATE()
+    END
+    IF NOT EXISTS (SELECT * FROM sys.columns
+                   WHERE Name = N'blob_url' AND Object_ID = Object_ID(N'TranslatedDocuments'))
+    BEGIN
+        ALTER TABLE TranslatedDocuments ADD blob_url NVARCHAR(MAX)
+    END
+    IF NOT EXISTS (SELECT * FROM sys.columns
+                   WHERE Name = N'user_ip' AND Object_ID = Object_ID(N'TranslatedDocuments'))
+    BEGIN
+        ALTER TABLE TranslatedDocuments ADD user_ip NVARCHAR(100)
+    END
+    IF NOT EXISTS (SELECT * FROM sys.columns
+                   WHERE Name = N'document_key' AND Object_ID = Object_ID(N'TranslatedDocuments'))
+    BEGIN
+        ALTER TABLE TranslatedDocuments ADD document_key NVARCHAR(36)
+    END
+END
+"""
+
+# Further output languages of a multi-target translation. The document row holds the source text
+# and the first language's translation; these rows share its document_key.
+TRANSLATION_OUTPUTS_DDL = """
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'TranslationOutputs')
+BEGIN
+    CREATE TABLE TranslationOutputs (
+        id INT PRIMARY KEY IDENTITY(1,1),
+        document_key NVARCHAR(36) NOT NULL,
+        output_language NVARCHAR(100),
+        translated_text NVARCHAR(MAX),
+        created_at DATETIME2 DEFAULT GETDATE()
+    )
+    CREATE INDEX IX_TranslationOutputs_document_key ON TranslationOutputs (document_key)
+END
+"""
+
+FEEDBACK_DDL = """
+IF NOT EXISTS (SELECT * FROM sys.tables WHERE name = 'Feedback')
+CREATE TABLE Feedback (
+    id INT PRIMARY KEY IDENTITY(1,1),
+    feedback_text NVARCHAR(MAX),
+    created_at DATETIME2 DEFAULT GETDATE()
+)
+"""
+
+TRANSLATED_DOCUMENTS_INSERT = """INSERT INTO TranslatedDocuments (input_text, detected_language, translated_text, output_language, blob_url, user_ip) VALUES (?, ?, ?, ?, ?, ?)"""
+# pyodbc.SQL_WVARCHAR; ODBC type codes are fixed by the standard, so pyodbc isn't needed to name it.
+SQL_WVARCHAR = -9
+# Column size 0 binds NVARCHAR(MAX) for fast_executemany.
+TRANSLATED_DOCUMENTS_INPUT_SIZES = [
+    (SQL_WVARCHAR, 0, 0),
+    (SQL_WVARCHAR, 100, 0),
+    (SQL_WVARCHAR, 0, 0),
+    (SQL_WVARCHAR, 100, 0),
+    (SQL_WVARCHAR, 0, 0),
+    (SQL_WVARCHAR, 100, 0),
+]
+MULTI_TARGET_DOCUMENTS_INSERT = """INSERT INTO TranslatedDocuments (input_text, detected_language, translated_text, output_language, blob_url, user_ip, document_key) VALUES (?, ?, ?, ?, ?, ?, ?)"""
+MULTI_TARGET_DOCUMENTS_INPUT_SIZES = TRANSLATED_DOCUMENTS_INPUT_SIZES + [(SQL_WVARCHAR, 36, 0)]
+TRANSLATION_OUTPUTS_INSERT = """INSERT INTO TranslationOutputs (document_key, output_language, translated_text) VALUES (?, ?, ?)"""
+TRANSLATION_OUTPUTS_INPUT_SIZES = [
+    (SQL_WVARCHAR, 36, 0),
+    (SQL_WVARCHAR, 100, 0),
+    (SQL_WVARCHAR, 0, 0),
+]
+JOURNAL_DIR = os.environ.get('WRITE_BEHIND_JOURNAL_DIR',
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), 'write_behind_journal'))
+
+MIGRATIONS = [
+    ('TranslatedDocuments', TRANSLATED_DOCUMENTS_DDL),
+    ('Feedback', FEEDBACK_DDL),
+    ('TranslationOutputs', TRANSLATION_OUTPUTS_DDL),
+]
+
+
+def build_connection_string():
+    driver = 'ODBC Driver 18 for SQL Server'
+    return (
+        f"DRIVER={{{driver}}};"
+        f"SERVER={os.environ.get('DB_SERVER')};"
+        f"DATABASE={os.environ.get('DB_NAME')};"
+        f"UID={os.environ.get('DB_USERNAME')};"
+        f"PWD={os.environ.get('DB_PASSWORD')};"
+        "TrustServerCertificate=yes;"
+        f"Connection Timeout={CONNECTION_TIMEOUT_SECONDS};"
+    )
+
+
+class ConnectionPool:
+    """Bounded pool of pyodbc connections.
+
+    At most max_size connections exist at once; callers wait up to `timeout` seconds for one to
+    be returned. Connections that sat idle are pinged before reuse and replaced if they are dead,
+    and connections that raised during use are discarded rather than returned to the pool.
+    """
+
+    def __init__(self, connect, max_size=POOL_SIZE, timeout=POOL_TIMEOUT_SECONDS,
+                 health_check_after=HEALTH_CHECK_AFTER_SECONDS):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._counters = {'opened': 0, 'closed': 0, 'checkouts': 0, 'health_check_failures': 0, 'in_use': 0}
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of the with-block."""
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No database connection available after {self.timeout}s")
+        conn = None
+        try:
+            conn = self._checkout()
+            metrics.observe('db_checkout', time.perf_counter() - start)
+            yield conn
+        except Exception:
+            self._discard(conn)
+            conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._idle.put((conn, time.monotonic()))
+            with self._lock:
+                self._counters['in_use'] -= 1
+            self._slots.release()
+
+    def _checkout(self):
+        with self._lock:
+            self._counters['checkouts'] += 1
+            self._counters['in_use'] += 1
+        while True:
+            try:
+                conn, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - returned_at < self.health_check_after or self._is_alive(conn):
+                return conn
+            self._discard(conn)
+        conn = self._connect()
+        with self._lock:
+            self._counters['opened'] += 1
+        return conn
+
+    def _is_alive(self, conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1').fetchone()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding dead database connection: {e}")
+            with self._lock:
+                self._counters['health_check_failures'] += 1
+            return False
+
+    def _discard(self, conn):
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._counters['closed'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, idle=self._idle.qsize(), max_size=self.max_size)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_schema_ready = False
+_schema_lock = threading.Lock()
+_document_writer = None
+_multi_target_writer = None
+_document_writer_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            conn_str = build_connection_string()
+            # Imported here so the ODBC driver manager is only loaded by processes that use the database
+            import pyodbc
+            _pool = ConnectionPool(lambda: pyodbc.connect(conn_str))
+        return _pool
+
+
+def pool_stats():
+    """The pool's counters, or {} if this process has not connected yet (pyodbc stays unloaded)."""
+    pool = _pool
+    return pool.stats() if pool is not None else {}
+
+
+def migrate_schema():
+    """Create or upgrade every table the app writes to. Safe to run repeatedly."""
+    with get_pool().connection() as conn:
+        with conn.cursor() as cursor:
+            for table, ddl in MIGRATIONS:
+                cursor.execute(ddl)
+                logger.info(f"Checked/created/updated table '{table}'.")
+        conn.commit()
+
+
+def ensure_schema():
+    """Run the schema migration once per process; later calls return immediately.
+
+    A failed migration is logged and retried on the next call, so the statement that follows can
+    still run against tables created by an earlier deploy.
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        try:
+            migrate_schema()
+            _schema_ready = True
+        except Exception as e:
+            logger.error(f"Failed to check/create/update tables: {e}")
+
+
+@contextmanager
+def connection():
+    """Check out a pooled connection, making sure the schema has been migrated first."""
+    ensure_schema()
+    with get_pool().connection() as conn:
+        yield conn
+
+
+def get_document_writer():
+    """Return the write-behind queue that persists TranslatedDocuments rows."""
+    global _document_writer
+    with _document_writer_lock:
+        if _document_writer is None:
+            _document_writer = WriteBehindQueue('TranslatedDocuments', TRANSLATED_DOCUMENTS_INSERT, connection,
+                                                JOURNAL_DIR, input_sizes=TRANSLATED_DOCUMENTS_INPUT_SIZES)
+        return _document_writer
+
+
+def _multi_target_statements(rows):
+    """One TranslatedDocuments row per queued document, and a TranslationOutputs row per further language."""
+    documents = [row[:7] for row in rows]
+    outputs = [(row[6], language, text) for row in rows for language, text in row[7]]
+    statements = [(MULTI_TARGET_DOCUMENTS_INSERT, documents, MULTI_TARGET_DOCUMENTS_INPUT_SIZES)]
+    if outputs:
+        statements.append((TRANSLATION_OUTPUTS_INSERT, outputs, TRANSLATION_OUTPUTS_INPUT_SIZES))
+    return statements
+
+
+def get_multi_target_writer():
+    """Return the write-behind queue for documents translated into several languages.
+
+    Rows are (input text, detected language, first translation, first language, blob URL, user IP,
+    document key, [[language, translation], ...] for the other languages); each is written in
+    the same transaction as its outputs.
+    """
+    global _multi_target_writer
+    with _document_writer_lock:
+        if _multi_target_writer is None:
+            _multi_target_writer = WriteBehindQueue('TranslationOutputs', MULTI_TARGET_DOCUMENTS_INSERT, connection,
+                                                    JOURNAL_DIR, statements=_multi_target_statements)
+        return _multi_target_writer
+
+
+def document_writer_stats():
+    """The TranslatedDocuments queue's counters, or {} if nothing has been queued in this process."""
+    writer = _document_writer
+    return writer.stats() if writer is not None else {}
+
+
+def multi_target_writer_stats():
+    """The multi-target queue's counters, or {} if nothing has been queued in this process."""
+    writer = _multi_target_writer
+    return writer.stats() if writer is not None else {}
+
+
+def enqueue_document(extracted_text, detected_language, translations, blob_url, user_ip):
+    """Queue a translated document; translations maps each output language to its text, in request order.
+
+    The source text is stored once however many languages it was translated into.
+    """
+    (output_language, translated_text), *others = translations.items()
+    row = (extracted_text, detected_language, translated_text, output_language, blob_url or "", user_ip)
+    if not others:
+        get_document_writer().enqueue(row)
+        return
+    get_multi_target_writer().enqueue(row + (str(uuid.uuid4()), [list(output) for output in others]))
@@ -0,0 +1,123 @@
+"""Layout-preserving translation of DOCX and PDF files.
+
+Documents are read into their paragraph/run (DOCX) or block/span (PDF) structure, every distinct
+text block is translated once in shared batches, and the translations are written back in place,
+so the user downloads a translated file instead of a flat string.
+python-docx and PyMuPDF are imported on first use.
+"""
+import html
+import io
+import logging
+import os
+
+from extraction import spool_to_disk
+from translation_engine import translate_blocks
+
+logger = logging.getLogger(__name__)
+
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PDF_MIMETYPE = 'application/pdf'
+PDF_FONT_FAMILY = 'sans-serif'
+
+
+def _iter_docx_paragraphs(container):
+    """Yield every paragraph in the body, tables (including nested ones) of a document part."""
+    yield from container.paragraphs
+    for table in container.tables:
+        seen = set()
+        for row in table.rows:
+            for cell in row.cells:
+                # Merged cells are returned once per grid position they span.
+                if id(cell._tc) in seen:
+                    continue
+                seen.add(id(cell._tc))
+                yield from _iter_docx_paragraphs(cell)
+
+
+def _paragraph_runs(paragraph):
+    from docx.text.hyperlink import Hyperlink
+    runs = []
+    for item in paragraph.iter_inner_content():
+        runs.extend(item.runs if isinstance(item, Hyperlink) else [item])
+    return runs
+
+
+def translate_docx(file_stream, target_language, client, source_language=None, memory=None):
+    """Translate a .docx upload paragraph by paragraph and return (docx bytes, source language).
+
+    The translated paragraph is written into its first run, which keeps the paragraph style and
+    the first run's character formatting; the remaining runs are emptied.
+    """
+    import docx
+    file_stream.seek(0)
+    document = docx.Document(file_stream)
+    parts = [document]
+    for section in document.sections:
+        parts.extend([section.header, section.footer])
+
+    paragraphs = []
+    for part in parts:
+        for paragraph in _iter_docx_paragraphs(part):
+            runs = [run for run in _paragraph_runs(paragraph) if run.text]
+            if runs:
+                paragraphs.append((runs, ''.join(run.text for run in runs)))
+
+    translations, source_language = translate_blocks([text for _, text in paragraphs], target_language, client,
+                                                     source_language, memory=memory)
+    logger.info(f"Translated {len(translations)} distinct paragraphs of {len(paragraphs)} in DOCX.")
+    for runs, text in paragraphs:
+        if text in translations:
+            runs[0].text = translations[text]
+            for run in runs[1:]:
+                run.text = ''
+
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue(), source_language
+
+
+def _pdf_text_blocks(page):
+    """(rect, text, font size, color, bold) for each text block on the page."""
+    import fitz  # PyMuPDF
+    blocks = []
+    for block in page.get_text('dict', flags=fitz.TEXTFLAGS_TEXT)['blocks']:
+        if block['type'] != 0:
+            continue
+        lines = [''.join(span['text'] for span in line['spans']) for line in block['lines']]
+        text = ' '.join(line.strip() for line in lines if line.strip())
+        if not text:
+            continue
+        span = block['lines'][0]['spans'][0]
+        blocks.append((fitz.Rect(block['bbox']), text, span['size'], span['color'], bool(span['flags'] & 16)))
+    return blocks
+
+
+def translate_pdf(file_stream, target_language, client, source_language=None, memory=None):
+    """Translate a PDF upload block by block and return (pdf bytes, source language).
+
+    Each text block is removed with a redaction (images and vector graphics are kept) and the
+    translation is set into the same rectangle, shrunk to fit when it runs longer than the source.
+    """
+    import fitz  # PyMuPDF
+    path = spool_to_disk(file_stream)
+    try:
+        with fitz.open(path) as doc:
+            pages = [_pdf_text_blocks(page) for page in doc]
+            translations, source_language = translate_blocks(
+                [text for blocks in pages for _, text, _, _, _ in blocks], target_language, client,
+                source_language, memory=memory)
+            logger.info(f"Translated {len(translations)} distinct text blocks in {doc.page_count}-page PDF.")
+
+            for page, blocks in zip(doc, pages):
+                if not blocks:
+                    continue
+                for rect, _, _, _, _ in blocks:
+                    page.add_redact_annot(rect)
+                page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE)
+                for rect, text, size, color, bold in blocks:
+                    css = (f"* {{font-family: {PDF_FONT_FAMILY}; font-size: {size:.1f}pt; color: #{color:06x};"
+                           f" font-weight: {'bold' if bold else 'normal'};}}")
+                    page.insert_htmlbox(rect, html.escape(translations.get(text, text)), css=css)
+            return doc.tobytes(garbage=3, deflate=True), source_language
+    finally:
+        os.remove(path)
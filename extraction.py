@@ -0,0 +1,237 @@
+"""Text extraction from uploaded documents.
+
+PDF uploads are spooled to disk and their pages extracted in parallel on a process pool
+(PyMuPDF is CPU-bound), yielding page texts in order as they become ready so translation can
+start before the whole document has been read. DOCX uploads are parsed straight from the
+in-memory zip with an incremental XML parser.
+"""
+import itertools
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+PDF_WORKERS = int(os.environ.get('PDF_EXTRACTION_WORKERS', os.cpu_count() or 1))
+# Documents with fewer pages than this are extracted in-process; the pool is not worth it.
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', 16))
+PDF_PAGES_PER_TASK = 8
+COPY_BUFFER_BYTES = 1024 * 1024
+# Limits that keep huge or zip-bomb DOCX uploads from stalling a worker.
+DOCX_MAX_XML_BYTES = int(os.environ.get('DOCX_MAX_XML_BYTES', 100 * 1024 * 1024))
+DOCX_MAX_PARAGRAPHS = int(os.environ.get('DOCX_MAX_PARAGRAPHS', 200000))
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_DOCX_TEXT = f'{_W}t'
+_DOCX_TAB = f'{_W}tab'
+_DOCX_BREAK_TAGS = {f'{_W}br', f'{_W}cr'}
+_DOCX_PARAGRAPH = f'{_W}p'
+# The element paragraphs hang off: <w:body> in the main document, <w:hdr>/<w:ftr> in headers and footers.
+_DOCX_BODY_TAGS = {f'{_W}body', f'{_W}hdr', f'{_W}ftr'}
+_DOCX_HEADER_RE = re.compile(r'word/header[0-9]*\.xml')
+_DOCX_FOOTER_RE = re.compile(r'word/footer[0-9]*\.xml')
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the web worker is multi-threaded and forking it could copy held locks.
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def parse_page_range(spec, page_count):
+    """Turn a 1-based spec like '1-3,7,10-' into sorted zero-based page indices."""
+    if not spec or not spec.strip():
+        return list(range(page_count))
+    pages = set()
+    for start, stop in _page_spans(spec):
+        pages.update(range(start - 1, min(stop or page_count, page_count)))
+    return sorted(pages)
+
+
+def check_page_range(spec):
+    """Raise ValueError if spec is not a valid page range, before any document is opened."""
+    if spec and spec.strip():
+        for _ in _page_spans(spec):
+            pass
+
+
+def _page_spans(spec):
+    """(first, last) 1-based page numbers of each part of the spec; last is None for an open end."""
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, _, stop = part.partition('-')
+                start = int(start) if start.strip() else 1
+                stop = int(stop) if stop.strip() else None
+            else:
+                start = stop = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid page range: {part}") from None
+        if start < 1 or (stop is not None and stop < start):
+            raise ValueError(f"Invalid page range: {part}")
+        yield start, stop
+
+
+def spool_to_disk(file_stream, suffix='.pdf'):
+    """Copy an upload to a temporary file in fixed-size chunks and return its path."""
+    file_stream.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp_file:
+        shutil.copyfileobj(file_stream, tmp_file, COPY_BUFFER_BYTES)
+    file_stream.seek(0)
+    return tmp_file.name
+
+
+def _page_text(page):
+    # A page without fonts has no text layer (e.g. a scanned image), so skip the full text pass.
+    if not page.get_fonts():
+        return ''
+    return page.get_text()
+
+
+def _extract_pages(path, page_numbers):
+    """Runs in a pool worker: extract the text of the given pages."""
+    import fitz  # PyMuPDF
+    with fitz.open(path) as doc:
+        return [_page_text(doc[number]) for number in page_numbers]
+
+
+def iter_pdf_pages(pdf_file, page_range=None):
+    """Yield the text of each selected page, in page order, as soon as it is extracted."""
+    # PyMuPDF is imported on first use, so workers that never see a PDF don't load it
+    import fitz
+    path = spool_to_disk(pdf_file)
+    try:
+        with fitz.open(path) as doc:
+            page_numbers = parse_page_range(page_range, doc.page_count)
+            if len(page_numbers) < PDF_PARALLEL_MIN_PAGES:
+                for number in page_numbers:
+                    yield _page_text(doc[number])
+                return
+
+        pool = _get_pool()
+        tasks = [page_numbers[i:i + PDF_PAGES_PER_TASK] for i in range(0, len(page_numbers), PDF_PAGES_PER_TASK)]
+        # Keep a bounded window of tasks in flight so a huge PDF doesn't pile up finished pages in memory.
+        window = deque()
+        remaining = iter(tasks[1:])
+        for task in itertools.islice(remaining, PDF_WORKERS * 2):
+            window.append(pool.submit(_extract_pages, path, task))
+        # The first pages are extracted right here, so translation can start while the pool works.
+        with fitz.open(path) as doc:
+            for number in tasks[0]:
+                yield _page_text(doc[number])
+        while window:
+            pages = window.popleft().result()
+            next_task = next(remaining, None)
+            if next_task is not None:
+                window.append(pool.submit(_extract_pages, path, next_task))
+            yield from pages
+    finally:
+        os.remove(path)
+
+
+def extract_text_from_pdf(pdf_file, page_range=None):
+    return ''.join(iter_pdf_pages(pdf_file, page_range))
+
+
+class DocumentTooLargeError(ValueError):
+    """The upload exceeds a configured extraction limit."""
+
+
+class _LimitedReader:
+    """File-like wrapper that raises once a document's decompressed-byte budget is used up."""
+
+    def __init__(self, raw, budget):
+        self.raw = raw
+        self.budget = budget  # Shared by all parts of one document: {'limit': ..., 'remaining': ...}
+
+    def read(self, size=-1):
+        data = self.raw.read(size)
+        self.budget['remaining'] -= len(data)
+        if self.budget['remaining'] < 0:
+            raise DocumentTooLargeError(f"DOCX text exceeds {self.budget['limit']} decompressed bytes")
+        return data
+
+
+def _docx_text_parts(names):
+    """Headers, then the main document, then footers: the order docx2txt used."""
+    headers = sorted(name for name in names if _DOCX_HEADER_RE.fullmatch(name))
+    footers = sorted(name for name in names if _DOCX_FOOTER_RE.fullmatch(name))
+    return headers + ['word/document.xml'] + footers
+
+
+def iter_docx_paragraphs(docx_file_stream, max_xml_bytes=None, max_paragraphs=None):
+    """Yield the text of each paragraph of a .docx upload, read straight from the zip in memory.
+
+    The XML parts are parsed incrementally, and embedded media are never read. Raises
+    DocumentTooLargeError past DOCX_MAX_XML_BYTES of decompressed XML or DOCX_MAX_PARAGRAPHS paragraphs.
+    """
+    limit = max_xml_bytes or DOCX_MAX_XML_BYTES
+    budget = {'limit': limit, 'remaining': limit}
+    max_paragraphs = max_paragraphs or DOCX_MAX_PARAGRAPHS
+    paragraphs = 0
+    docx_file_stream.seek(0)
+    with zipfile.ZipFile(docx_file_stream) as docx_zip:
+        for name in _docx_text_parts(docx_zip.namelist()):
+            with docx_zip.open(name) as part:
+                parts = []
+                body = None
+                for event, element in ElementTree.iterparse(_LimitedReader(part, budget), events=('start', 'end')):
+                    if event == 'start':
+                        if body is None and element.tag in _DOCX_BODY_TAGS:
+                            body = element
+                        elif element.tag in _DOCX_BREAK_TAGS:
+                            parts.append('\n')
+                        elif element.tag == _DOCX_TAB:
+                            parts.append('\t')
+                        continue
+                    if element.tag == _DOCX_TEXT:
+                        parts.append(element.text or '')
+                    elif element.tag == _DOCX_PARAGRAPH:
+                        paragraphs += 1
+                        if paragraphs > max_paragraphs:
+                            raise DocumentTooLargeError(f"DOCX has more than {max_paragraphs} paragraphs")
+                        yield ''.join(parts) + '\n\n'
+                        parts = []
+                        if body is not None:
+                            body.clear()  # Drop parsed paragraphs so memory stays flat on huge documents
+
+
+def iter_docx_text(docx_file_stream, max_xml_bytes=None, max_paragraphs=None):
+    """Yield a .docx upload's text in pieces that join to extract_text_from_docx's stripped text.
+
+    Leading whitespace is dropped, and blank paragraphs are held back until more text follows, so
+    the document's trailing whitespace is never yielded.
+    """
+    text_seen = False
+    held = []  # The last paragraph with text and the blank ones after it
+    for paragraph in iter_docx_paragraphs(docx_file_stream, max_xml_bytes, max_paragraphs):
+        if not text_seen:
+            paragraph = paragraph.lstrip()
+            if not paragraph:
+                continue
+            text_seen = True
+        if paragraph.strip():
+            yield from held
+            held = []
+        held.append(paragraph)
+    tail = ''.join(held).rstrip()
+    if tail:
+        yield tail
+
+
+def extract_text_from_docx(docx_file_stream):
+    return ''.join(iter_docx_text(docx_file_stream))
@@ -0,0 +1,33 @@
+"""gunicorn settings, read automatically when gunicorn is started from the repository root.
+
+This includes App Service's default `gunicorn app:app` startup, so preloading is opt-in: with
+GUNICORN_PRELOAD=true the master loads the app (preload_app) and imports the heavy SDKs once, and
+workers fork from it with them already in memory, so booting or replacing a worker doesn't import
+them again. Nothing in the app opens a connection or starts a thread at import time, so no state
+is shared across the fork. Pass `-c /dev/null` to ignore this file.
+"""
+import importlib
+import os
+
+wsgi_app = 'app:create_app()'
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+# Imported in the master; a worker that never needs one still shares its pages with the master.
+PRELOAD_MODULES = [
+    'fitz',
+    'docx',
+    'pyodbc',
+    'azure.storage.blob',
+    'azure.cognitiveservices.speech',
+]
+
+
+def when_ready(server):
+    """Runs in the master once it is listening, before the first worker is forked."""
+    if not server.cfg.preload_app:
+        return
+    for module in PRELOAD_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            server.log.warning(f"Could not preload {module}: {e}")
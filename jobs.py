@@ -0,0 +1,184 @@
+"""Background jobs for long-running document translations.
+
+A job runs its pipeline on a worker thread and records per-stage status, progress counters and
+partial results as it goes. Job state is also written to a JSON file in JOBS_DIR, so a poll that
+lands on another gunicorn worker process can still answer.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Finished jobs (and their files) are forgotten after this long.
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', 24 * 3600))
+JOBS_DIR = os.environ.get('JOBS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs'))
+# Progress updates are written to disk at most this often; status changes are written immediately.
+PERSIST_INTERVAL_SECONDS = 0.5
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class Job:
+    """State of one pipeline run: status, stages, progress counters and partial results."""
+
+    def __init__(self, stages, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.status = 'queued'
+        self.stages = {stage: 'pending' for stage in stages}
+        self.progress = {}
+        self.parts = []
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._persisted_at = 0.0
+
+    @contextmanager
+    def stage(self, name):
+        """Mark a stage as running for the duration of the with-block."""
+        self.set_stage(name, 'running')
+        try:
+            yield
+        except Exception:
+            self.set_stage(name, 'failed')
+            raise
+        self.set_stage(name, 'completed')
+
+    def set_stage(self, name, status):
+        with self._lock:
+            self.stages[name] = status
+        self._persist(force=True)
+
+    def advance(self, counter, amount=1):
+        with self._lock:
+            self.progress[counter] = self.progress.get(counter, 0) + amount
+        self._persist()
+
+    def add_part(self, part):
+        """Record a partial result (e.g. a translated group of pages), in document order."""
+        with self._lock:
+            self.parts.append(part)
+        self._persist()
+
+    def snapshot(self, since=0):
+        """JSON-serialisable state, with the partial results from index `since` on."""
+        with self._lock:
+            return {
+                'job_id': self.id,
+                'status': self.status,
+                'stages': dict(self.stages),
+                'progress': dict(self.progress),
+                'partial_results': self.parts[since:],
+                'next_part': len(self.parts),
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'finished_at': self.finished_at,
+            }
+
+    def _finish(self, status, result=None, error=None):
+        with self._lock:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished_at = time.time()
+            if status == 'failed':
+                self.stages = {name: 'failed' if stage == 'running' else stage for name, stage in self.stages.items()}
+        self._persist(force=True)
+
+    def _persist(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._persisted_at < PERSIST_INTERVAL_SECONDS:
+            return
+        self._persisted_at = now
+        path = _job_path(self.id)
+        try:
+            with open(f"{path}.tmp", 'w', encoding='utf-8') as job_file:
+                json.dump(self.snapshot(), job_file)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logger.warning(f"Could not persist job {self.id}: {e}")
+
+
+def _job_path(job_id):
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def submit(pipeline, *args, stages=(), **kwargs):
+    """Run pipeline(job, *args, **kwargs) on the worker pool and return the Job right away.
+
+    The pipeline's return value becomes the job result; an exception fails the job.
+    """
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    prune()
+    job = Job(stages)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    job._persist(force=True)
+    _executor.submit(_run, job, pipeline, args, kwargs)
+    return job
+
+
+def _run(job, pipeline, args, kwargs):
+    with job._lock:
+        job.status = 'running'
+    job._persist(force=True)
+    try:
+        result = pipeline(job, *args, **kwargs)
+    except Exception as e:
+        logger.error(f"Job {job.id} failed: {e}")
+        job._finish('failed', error=str(e))
+        return
+    job._finish('completed', result=result)
+    logger.info(f"Job {job.id} completed in {job.finished_at - job.created_at:.1f}s")
+
+
+def get_snapshot(job_id, since=0):
+    """Current state of a job, from this process or from another worker's job file; None if unknown."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        return job.snapshot(since)
+    if not all(c in '0123456789abcdef' for c in job_id):
+        return None
+    try:
+        with open(_job_path(job_id), encoding='utf-8') as job_file:
+            snapshot = json.load(job_file)
+    except (OSError, ValueError):
+        return None
+    snapshot['partial_results'] = snapshot['partial_results'][since:]
+    return snapshot
+
+
+def prune():
+    """Forget finished jobs, and remove job files, older than JOB_TTL_SECONDS."""
+    cutoff = time.time() - JOB_TTL_SECONDS
+    with _jobs_lock:
+        for job_id in [job_id for job_id, job in _jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del _jobs[job_id]
+    try:
+        entries = list(os.scandir(JOBS_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+
+
+def stats():
+    with _jobs_lock:
+        statuses = [job.status for job in _jobs.values()]
+    return {status: statuses.count(status) for status in ('queued', 'running', 'completed', 'failed')}
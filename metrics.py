@@ -0,0 +1,216 @@
+"""In-process timing spans, counters and request traces, exposed in the Prometheus text format.
+
+Pipeline stages are timed with `span()` (or `observe()` for a duration measured elsewhere) and
+go into one histogram per stage. While a request is being handled, every span is also added to
+that request's trace, including spans on worker threads that run in a copied context. The trace
+becomes the Server-Timing header (with METRICS_SERVER_TIMING=true) and requests slower than
+SLOW_REQUEST_SECONDS keep their trace for /metrics/slow.
+
+Metrics are per process; with several gunicorn workers each one reports its own.
+"""
+import contextvars
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PREFIX = 'translation_app'
+SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', 'false').lower() == 'true'
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 5))
+# Share of slow requests whose trace is kept and logged.
+SLOW_TRACE_SAMPLE_RATE = float(os.environ.get('SLOW_TRACE_SAMPLE_RATE', 1.0))
+SLOW_TRACES_MAX = int(os.environ.get('SLOW_TRACES_MAX', 100))
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_collectors = {}
+_slow_traces = deque(maxlen=SLOW_TRACES_MAX)
+_trace = contextvars.ContextVar('metrics_trace', default=None)
+_NAME_RE = re.compile(r'[^a-zA-Z0-9_]')
+
+
+class Trace:
+    """Spans recorded while one request was handled, summed per stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def totals(self):
+        """{stage: (total seconds, count)}, in order of first appearance."""
+        totals = {}
+        for stage, seconds in list(self.spans):
+            total, count = totals.get(stage, (0.0, 0))
+            totals[stage] = (total + seconds, count + 1)
+        return totals
+
+
+def count(name, amount=1, **labels):
+    """Add to a counter, exported as <PREFIX>_<name>_total."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(stage, seconds):
+    """Record a stage duration in its histogram and in the current request's trace."""
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = [0] * len(BUCKETS) + [0.0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        histogram[-1] += seconds
+    trace = _trace.get()
+    if trace is not None:
+        trace.spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage):
+    """Time the with-block as one occurrence of stage, whether or not it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def timed_iter(iterable, stage, counter=None, **labels):
+    """Yield from iterable, timing only the work done producing items (e.g. lazy page extraction).
+
+    The total is recorded as one occurrence of stage when the iterator is exhausted or closed.
+    With counter, the length of every item is also added to that counter.
+    """
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            if counter:
+                count(counter, len(item), **labels)
+            yield item
+    finally:
+        observe(stage, elapsed)
+
+
+def register_collector(name, collect):
+    """Export the numeric values of collect() (e.g. a module's stats()) as gauges named <PREFIX>_<name>_<key>."""
+    with _lock:
+        _collectors[name] = collect
+
+
+def start_trace(name):
+    _trace.set(Trace(name))
+
+
+def finish_trace(status):
+    """End the current request's trace and record it; returns the Trace (or None if none was started)."""
+    trace = _trace.get()
+    if trace is None:
+        return None
+    _trace.set(None)
+    elapsed = time.perf_counter() - trace.started
+    observe_request(trace.name, status, elapsed)
+    if elapsed >= SLOW_REQUEST_SECONDS and random.random() < SLOW_TRACE_SAMPLE_RATE:
+        stages = {stage: {'seconds': round(total, 4), 'count': n} for stage, (total, n) in trace.totals().items()}
+        with _lock:
+            _slow_traces.append({'request': trace.name, 'status': status, 'seconds': round(elapsed, 4),
+                                 'finished_at': time.time(), 'stages': stages})
+        logger.warning(f"Slow request {trace.name} ({status}) took {elapsed:.2f}s: {stages}")
+    return trace
+
+
+def observe_request(endpoint, status, seconds):
+    count('requests', endpoint=endpoint, status=status)
+    observe(f"request:{endpoint}", seconds)
+
+
+def server_timing(trace):
+    """Server-Timing header value for a trace; spans on parallel threads are summed per stage."""
+    return ', '.join(f'{_NAME_RE.sub("_", stage)};desc="{n}x";dur={total * 1000:.1f}'
+                     for stage, (total, n) in trace.totals().items())
+
+
+def slow_traces():
+    with _lock:
+        return list(_slow_traces)
+
+
+def render():
+    """All counters, stage histograms and collector gauges in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {stage: list(values) for stage, values in _histograms.items()}
+        collectors = dict(_collectors)
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        metric = f"{PREFIX}_{_NAME_RE.sub('_', name)}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for (counter_name, labels), value in sorted(counters.items(), key=lambda item: str(item[0])):
+            if counter_name == name:
+                lines.append(f"{metric}{_labels(labels)} {value}")
+
+    for kind, metric in (('request:', f"{PREFIX}_request_seconds"), ('', f"{PREFIX}_stage_seconds")):
+        selected = {stage: values for stage, values in histograms.items() if stage.startswith('request:') == bool(kind)}
+        if not selected:
+            continue
+        label = 'endpoint' if kind else 'stage'
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, values in sorted(selected.items()):
+            labels = ((label, stage[len(kind):]),)
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, values):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{_labels(labels)} {values[-1]:.6f}")
+            lines.append(f"{metric}_count{_labels(labels)} {cumulative}")
+
+    for name, collect in sorted(collectors.items()):
+        try:
+            values = collect()
+        except Exception as e:
+            logger.warning(f"Metrics collector '{name}' failed: {e}")
+            continue
+        for key, value in _flatten(values, name):
+            metric = f"{PREFIX}_{_NAME_RE.sub('_', key)}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def _flatten(values, prefix):
+    """(name, number) pairs for the numeric leaves of nested stats dicts."""
+    if isinstance(values, bool):
+        yield prefix, int(values)
+    elif isinstance(values, (int, float)):
+        yield prefix, values
+    elif isinstance(values, dict):
+        for key, value in values.items():
+            yield from _flatten(value, f"{prefix}_{key}")
@@ -0,0 +1,206 @@
+"""Character quotas for the Azure Translator and Speech keys, shared by every process that uses them.
+
+Each key has a token bucket that refills at its characters-per-minute quota. The bucket lives in
+a small SQLite file, so the gunicorn workers and the Excel batch scripts on the same host all
+draw from the same budget instead of discovering it through 429s.
+
+Callers belong to a priority class. Interactive calls (web requests) may drain the bucket;
+batch calls (Excel scripts, background jobs) only take characters while more than
+BATCH_RESERVE_FRACTION of the bucket is left, so they fill spare quota and back off as soon as
+interactive traffic needs it. The class is taken from the current context:
+
+    with rate_limiter.priority(rate_limiter.BATCH):
+        translate_blocks(...)
+"""
+import contextvars
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+STATE_PATH = os.environ.get('RATE_LIMIT_STATE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rate_limits.sqlite3'))
+# Set these to the quota of the key's pricing tier; 0 disables the limit.
+TRANSLATOR_CHARS_PER_MINUTE = int(os.environ.get('TRANSLATOR_CHARS_PER_MINUTE', 600000))
+SPEECH_CHARS_PER_MINUTE = int(os.environ.get('SPEECH_CHARS_PER_MINUTE', 60000))
+# Share of the bucket that batch callers leave for interactive ones.
+BATCH_RESERVE_FRACTION = float(os.environ.get('BATCH_RESERVE_FRACTION', 0.25))
+# Interactive callers give up after this long; batch callers wait as long as it takes.
+INTERACTIVE_MAX_WAIT_SECONDS = float(os.environ.get('INTERACTIVE_MAX_WAIT_SECONDS', 30))
+# Waiters re-check the shared bucket at least this often, since other processes may have drawn from it.
+POLL_SECONDS = 1.0
+
+_priority = contextvars.ContextVar('quota_priority', default=INTERACTIVE)
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+class QuotaExceededError(Exception):
+    """Raised when an interactive call cannot get quota within INTERACTIVE_MAX_WAIT_SECONDS."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def priority(level):
+    """Run the with-block (and work it hands to executors via copied contexts) at the given priority."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+class CharacterQuota:
+    """A per-key token bucket of characters, stored in SQLite and shared across processes."""
+
+    def __init__(self, name, chars_per_minute, state_path=STATE_PATH, batch_reserve_fraction=BATCH_RESERVE_FRACTION):
+        self.name = name
+        self.chars_per_minute = chars_per_minute
+        self.capacity = float(chars_per_minute)
+        self.rate = chars_per_minute / 60.0
+        self.batch_reserve = self.capacity * batch_reserve_fraction
+        self._lock = threading.Lock()
+        self._counters = {f"{level}_{counter}": 0 for level in (INTERACTIVE, BATCH)
+                          for counter in ('chars', 'calls', 'waits', 'wait_seconds', 'timeouts')}
+        self._counters['throttle_pauses'] = 0
+
+        self._conn = sqlite3.connect(state_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                paused_until REAL NOT NULL
+            )
+        """)
+        self._conn.execute('INSERT OR IGNORE INTO buckets VALUES (?, ?, ?, 0)', (name, self.capacity, time.time()))
+
+    @property
+    def enabled(self):
+        return self.chars_per_minute > 0
+
+    def acquire(self, chars, level=None, max_wait=None):
+        """Take chars from the bucket, waiting for it to refill; returns the seconds waited.
+
+        Interactive callers raise QuotaExceededError after INTERACTIVE_MAX_WAIT_SECONDS (or max_wait).
+        """
+        level = level or current_priority()
+        if not self.enabled or chars <= 0:
+            return 0.0
+        if max_wait is None and level == INTERACTIVE:
+            max_wait = INTERACTIVE_MAX_WAIT_SECONDS
+        # A request larger than the bucket goes through once the bucket is full and leaves it in debt.
+        needed = min(chars + (self.batch_reserve if level == BATCH else 0), self.capacity)
+        start = time.monotonic()
+        waited = 0.0
+        while True:
+            wait = self._try_take(chars, needed)
+            if wait == 0:
+                break
+            if max_wait is not None and waited + wait > max_wait:
+                self._count(f"{level}_timeouts")
+                raise QuotaExceededError(f"The shared character quota is used up; try again in {wait:.0f}s.", wait)
+            time.sleep(min(wait, POLL_SECONDS))
+            waited = time.monotonic() - start
+        with self._lock:
+            self._counters[f"{level}_chars"] += chars
+            self._counters[f"{level}_calls"] += 1
+            if waited:
+                self._counters[f"{level}_waits"] += 1
+                self._counters[f"{level}_wait_seconds"] += waited
+        if waited > POLL_SECONDS:
+            logger.info(f"Waited {waited:.1f}s for {chars} {self.name} characters ({level}).")
+        return waited
+
+    def pause(self, seconds):
+        """Stop all callers for `seconds`, e.g. after the service answered 429 with Retry-After."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters['throttle_pauses'] += 1
+            now = time.time()
+            self._conn.execute('UPDATE buckets SET paused_until = max(paused_until, ?), tokens = min(tokens, 0), '
+                               'updated = ? WHERE name = ?', (now + seconds, now, self.name))
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            tokens, paused_until = self._refill(time.time())
+        counters.update({
+            'chars_per_minute': self.chars_per_minute,
+            'available_chars': int(max(tokens, 0)) if self.enabled else None,
+            'used_fraction': round(1 - max(tokens, 0) / self.capacity, 3) if self.enabled else 0.0,
+            'paused_seconds': round(max(paused_until - time.time(), 0), 1),
+        })
+        return counters
+
+    def _refill(self, now):
+        tokens, updated, paused_until = self._conn.execute(
+            'SELECT tokens, updated, paused_until FROM buckets WHERE name = ?', (self.name,)).fetchone()
+        return min(self.capacity, tokens + max(now - updated, 0) * self.rate), paused_until
+
+    def _try_take(self, chars, needed):
+        """Take chars if at least `needed` are available; otherwise return the seconds to wait."""
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes cannot both spend the same tokens.
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = time.time()
+                tokens, paused_until = self._refill(now)
+                if now < paused_until:
+                    wait = paused_until - now
+                elif tokens >= needed:
+                    tokens -= chars
+                    wait = 0.0
+                else:
+                    wait = (needed - tokens) / self.rate
+                self._conn.execute('UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?',
+                                   (tokens, now, self.name))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return wait
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+def get_quota(service, key, chars_per_minute):
+    """Return the process-wide quota for one subscription key of a service, created on first use."""
+    # Keyed by a hash so the state file never holds the key itself.
+    name = f"{service}:{hashlib.sha256((key or '').encode('utf-8')).hexdigest()[:12]}"
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = CharacterQuota(name, chars_per_minute)
+        return _limiters[name]
+
+
+def get_translator_quota():
+    return get_quota('translator', os.environ.get('AZURE_TRANSLATION_KEY'), TRANSLATOR_CHARS_PER_MINUTE)
+
+
+def get_speech_quota():
+    return get_quota('speech', os.environ.get('AZURE_SPEECH_KEY'), SPEECH_CHARS_PER_MINUTE)
+
+
+def stats():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
@@ -0,0 +1,362 @@
+"""Azure text-to-speech with a content-addressed audio cache and streaming playback.
+
+Audio is stored as <sha256(voice, format, text)>.mp3, so repeat requests are served from disk
+without calling Azure. First requests are synthesized in the background and their MP3 chunks
+can be streamed to the browser while synthesis is still running. Synthesis never runs on the
+translation request path. Each synthesis first takes its characters from the Speech key's
+shared quota (see rate_limiter).
+
+The state of a synthesis lives next to its audio, so every worker process sees it: <key>.mp3.part
+while it runs (created exclusively, so one process synthesizes a text at a time), <key>.mp3 when
+it completes and <key>.mp3.failed with the error when it fails.
+"""
+import contextvars
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+VOICE_NAME = 'en-US-JennyMultilingualNeural'
+# Name of a SpeechSynthesisOutputFormat member; the SDK itself is imported on first synthesis.
+OUTPUT_FORMAT = 'Audio16Khz32KBitRateMonoMp3'
+SPEECH_WORKERS = int(os.environ.get('SPEECH_WORKERS', 2))
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get('AUDIO_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+AUDIO_CACHE_MAX_AGE_SECONDS = int(os.environ.get('AUDIO_CACHE_MAX_AGE_SECONDS', 7 * 24 * 3600))
+# A .part file not written to for this long belongs to a worker that died mid-synthesis
+SPEECH_STALE_SECONDS = float(os.environ.get('SPEECH_STALE_SECONDS', 120))
+# How long /synthesize_speech waits for the first audio before answering
+SPEECH_START_TIMEOUT_SECONDS = float(os.environ.get('SPEECH_START_TIMEOUT_SECONDS', 30))
+# How often a listener in another worker checks a .part file for new audio
+PART_POLL_SECONDS = 0.05
+
+_executor = ThreadPoolExecutor(max_workers=SPEECH_WORKERS, thread_name_prefix='speech')
+_streams = {}
+_streams_lock = threading.Lock()
+_speech_config = None
+_config_lock = threading.Lock()
+_local = threading.local()
+_counters = {'cache_hits': 0, 'cache_misses': 0, 'syntheses_failed': 0, 'evicted_files': 0}
+
+
+class AudioStream:
+    """MP3 chunks of an in-progress synthesis, readable by any number of listeners."""
+
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self._condition = threading.Condition()
+
+    def append(self, chunk):
+        with self._condition:
+            self.chunks.append(chunk)
+            self._condition.notify_all()
+
+    def wait_for_audio(self, timeout):
+        """Block until the first chunk arrives or synthesis finishes, at most timeout seconds."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.chunks or self.done, timeout)
+
+    def finish(self, error=None):
+        with self._condition:
+            self.done = True
+            self.error = error
+            self._condition.notify_all()
+
+    def iter_chunks(self):
+        """Yield chunks as they are produced until synthesis finishes."""
+        position = 0
+        while True:
+            with self._condition:
+                while position >= len(self.chunks) and not self.done:
+                    self._condition.wait()
+                pending = self.chunks[position:]
+                finished = self.done
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+            if finished and position >= len(self.chunks):
+                return
+
+
+def _speechsdk():
+    # The Speech SDK loads a large native library, so workers that never synthesize don't import it
+    import azure.cognitiveservices.speech as speechsdk
+    return speechsdk
+
+
+class _Synthesizer:
+    """A reusable SpeechSynthesizer that forwards audio chunks to the current job's sink."""
+
+    def __init__(self):
+        # audio_config=None keeps the audio in memory and delivers it through the synthesizing event.
+        self.synthesizer = _speechsdk().SpeechSynthesizer(speech_config=get_speech_config(), audio_config=None)
+        self.synthesizer.synthesizing.connect(self._on_synthesizing)
+        self.sink = None
+
+    def _on_synthesizing(self, evt):
+        if self.sink is not None and evt.result.audio_data:
+            self.sink(evt.result.audio_data)
+
+    def speak(self, text, sink):
+        self.sink = sink
+        try:
+            return self.synthesizer.speak_text_async(text).get()
+        finally:
+            self.sink = None
+
+
+def get_speech_config():
+    """Return the process-wide SpeechConfig, created on first use."""
+    global _speech_config
+    with _config_lock:
+        if _speech_config is None:
+            speech_key = os.environ.get('AZURE_SPEECH_KEY')
+            speech_region = os.environ.get('AZURE_SPEECH_REGION')
+            if not speech_key or not speech_region:
+                raise ValueError("Azure speech service credentials are not set.")
+            speechsdk = _speechsdk()
+            _speech_config = speechsdk.SpeechConfig(subscription=speech_key, region=speech_region)
+            _speech_config.speech_synthesis_voice_name = VOICE_NAME
+            _speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat[OUTPUT_FORMAT])
+        return _speech_config
+
+
+def audio_key(text, voice=VOICE_NAME, output_format=OUTPUT_FORMAT):
+    # Hashed the way the SDK prints the enum member, which keeps existing cache keys valid
+    format_member = f"SpeechSynthesisOutputFormat.{output_format}"
+    return hashlib.sha256(f"{voice}\0{format_member}\0{text}".encode('utf-8')).hexdigest()
+
+
+def audio_filename(key):
+    return f"{key}.mp3"
+
+
+def _part_path(path):
+    return f"{path}.part"
+
+
+def _failed_path(path):
+    return f"{path}.failed"
+
+
+def _part_age(path):
+    """Seconds since the .part file of path was last written, or None if there is none."""
+    try:
+        return time.time() - os.path.getmtime(_part_path(path))
+    except FileNotFoundError:
+        return None
+
+
+def _claim(path):
+    """Create the .part file of path for writing, or return None if another synthesis holds it."""
+    for _ in range(2):
+        try:
+            return open(_part_path(path), 'xb')
+        except FileExistsError:
+            age = _part_age(path)
+            if age is not None and age <= SPEECH_STALE_SECONDS:
+                return None
+            logger.warning(f"Taking over abandoned synthesis '{os.path.basename(path)}'")
+            try:
+                os.remove(_part_path(path))
+            except FileNotFoundError:
+                pass
+    return None
+
+
+def submit_synthesis(text, directory):
+    """Make sure audio for text exists or is being produced, and return its cache key.
+
+    Cached audio is served as-is; a synthesis already in flight for the same text, in any worker,
+    is shared. A failed one is retried.
+    """
+    key = audio_key(text)
+    path = os.path.join(directory, audio_filename(key))
+    with _streams_lock:
+        if key in _streams:
+            return key
+        if os.path.exists(path):
+            os.utime(path)  # Refresh the eviction clock
+            _counters['cache_hits'] += 1
+            return key
+        os.makedirs(directory, exist_ok=True)
+        part = _claim(path)
+        if part is None:
+            return key
+        if os.path.exists(path):
+            # Another worker finished it between the checks
+            part.close()
+            os.remove(_part_path(path))
+            return key
+        if os.path.exists(_failed_path(path)):
+            os.remove(_failed_path(path))
+        _counters['cache_misses'] += 1
+        stream = _streams[key] = AudioStream(key)
+    # The copied context carries the caller's quota priority to the worker
+    _executor.submit(contextvars.copy_context().run, _run_synthesis, stream, part, text, path)
+    return key
+
+
+def _tail_part(part):
+    """Yield the audio of a .part file another worker is writing until it completes or is abandoned."""
+    with part:
+        last_write = time.monotonic()
+        while True:
+            chunk = part.read(64 * 1024)
+            if chunk:
+                last_write = time.monotonic()
+                yield chunk
+                continue
+            # Renamed to the .mp3 on success or removed on failure; either way nothing more is written
+            if not os.path.exists(part.name):
+                chunk = part.read()
+                if chunk:
+                    yield chunk
+                return
+            if time.monotonic() - last_write > SPEECH_STALE_SECONDS:
+                return
+            time.sleep(PART_POLL_SECONDS)
+
+
+def open_stream(filename, directory):
+    """Return an iterator over the audio of filename while it is being synthesized, or None if it is not."""
+    if not filename.endswith('.mp3'):
+        return None
+    with _streams_lock:
+        stream = _streams.get(filename[:-len('.mp3')])
+    if stream is not None:
+        return stream.iter_chunks()
+    try:
+        part = open(_part_path(os.path.join(directory, filename)), 'rb')
+    except (FileNotFoundError, IsADirectoryError):
+        return None
+    return _tail_part(part)
+
+
+def get_job(key, directory):
+    """Status of the synthesis for a cache key, or None if it is unknown."""
+    filename = audio_filename(key)
+    path = os.path.join(directory, filename)
+    # The .part file is checked first: it turns into the .mp3 atomically, and the .failed file is
+    # written before it is removed, so a synthesis that ends between the checks is still seen.
+    age = _part_age(path)
+    if age is not None:
+        if age > SPEECH_STALE_SECONDS:
+            return {'status': 'failed', 'filename': filename, 'error': "Speech synthesis was interrupted"}
+        return {'status': 'running', 'filename': filename, 'error': None}
+    if os.path.exists(path):
+        return {'status': 'completed', 'filename': filename, 'error': None}
+    try:
+        with open(_failed_path(path), encoding='utf-8') as f:
+            return {'status': 'failed', 'filename': filename, 'error': f.read()}
+    except FileNotFoundError:
+        return None
+
+
+def wait_for_audio(key, directory, timeout=SPEECH_START_TIMEOUT_SECONDS):
+    """Block until the synthesis of key has produced audio, finished or failed, and return get_job()."""
+    with _streams_lock:
+        stream = _streams.get(key)
+    if stream is not None:
+        stream.wait_for_audio(timeout)
+    else:
+        # Synthesized by another worker: wait for its .part file to get data or go away
+        part = _part_path(os.path.join(directory, audio_filename(key)))
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if os.path.getsize(part):
+                    break
+            except FileNotFoundError:
+                break
+            time.sleep(PART_POLL_SECONDS)
+    return get_job(key, directory)
+
+
+def stats():
+    with _streams_lock:
+        return dict(_counters, in_progress=len(_streams))
+
+
+def _run_synthesis(stream, part, text, path):
+    error = None
+    try:
+        with part:
+            waited = rate_limiter.get_speech_quota().acquire(len(text))
+            if waited:
+                metrics.observe('quota_wait', waited)
+            os.utime(part.name)  # A long quota wait is not an abandoned synthesis
+            if not hasattr(_local, 'synthesizer'):
+                _local.synthesizer = _Synthesizer()
+
+            def sink(chunk):
+                part.write(chunk)
+                part.flush()  # Listeners in other workers read the file as it grows
+                stream.append(chunk)
+            with metrics.span('speech_synthesis'):
+                result = _local.synthesizer.speak(text, sink)
+        metrics.count('speech_chars', len(text))
+        if result.reason == _speechsdk().ResultReason.SynthesizingAudioCompleted:
+            os.replace(part.name, path)
+            logger.info(f"Speech synthesized to '{os.path.basename(path)}'")
+        else:
+            error = f"Speech synthesis failed: {result.reason}"
+    except Exception as e:
+        error = f"Speech synthesis failed: {e}"
+    if error:
+        logger.error(error)
+        with _streams_lock:
+            _counters['syntheses_failed'] += 1
+        try:
+            with open(_failed_path(path), 'w', encoding='utf-8') as f:
+                f.write(error)
+            os.remove(part.name)
+        except OSError as e:
+            logger.error(f"Could not record the failed synthesis '{os.path.basename(path)}': {e}")
+
+    stream.finish(error)
+    with _streams_lock:
+        # Later listeners and status checks read the .mp3 or .failed file, from this worker or any other
+        del _streams[stream.key]
+    evict_audio_cache(os.path.dirname(path))
+
+
+def evict_audio_cache(directory, max_bytes=AUDIO_CACHE_MAX_BYTES, max_age_seconds=AUDIO_CACHE_MAX_AGE_SECONDS):
+    """Delete MP3s older than max_age_seconds, then the least recently used until under max_bytes."""
+    now = time.time()
+    files = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith('.failed') and now - entry.stat().st_mtime > max_age_seconds:
+            # Failure records only matter until the text is requested again
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        elif entry.is_file() and entry.name.endswith('.mp3'):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    evicted = 0
+    for mtime, size, path in files:
+        if now - mtime <= max_age_seconds and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        evicted += 1
+    if evicted:
+        with _streams_lock:
+            _counters['evicted_files'] += evicted
+        logger.info(f"Evicted {evicted} cached audio files.")
@@ -0,0 +1,306 @@
+"""Sentence-aware, batched translation against the Azure Translator /translate API."""
+import contextvars
+import logging
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Azure Translator v3 accepts at most 1000 array elements and 50,000 characters per request.
+MAX_ELEMENTS_PER_REQUEST = 1000
+MAX_CHARS_PER_REQUEST = 50000
+# Sentences longer than this are cut at the last whitespace before the limit.
+MAX_SEGMENT_CHARS = 5000
+# Sentences of MAX_SEGMENT_CHARS still fit a request sent to this many target languages.
+MAX_TARGETS_PER_REQUEST = MAX_CHARS_PER_REQUEST // MAX_SEGMENT_CHARS
+# Number of /translate requests kept in flight for a single document.
+MAX_IN_FLIGHT = int(os.environ.get('TRANSLATION_MAX_IN_FLIGHT', 4))
+# Size of the batch sent ahead of the others to learn the source language; kept small so the
+# rest of the document waits for a short round trip, not a full request body.
+DETECT_BATCH_CHARS = int(os.environ.get('TRANSLATION_DETECT_BATCH_CHARS', 1000))
+
+# Break after sentence-ending punctuation or on blank lines; the captured whitespace is kept as a separator.
+_BOUNDARY_RE = re.compile(r'((?<=[.!?。！？])\s+|\n\s*\n\s*)')
+
+
+def split_segments(text, max_segment_chars=MAX_SEGMENT_CHARS):
+    """Split text on sentence and paragraph boundaries.
+
+    Returns a list of strings that joins back to exactly the original text. Separators are kept
+    as whitespace-only entries so they pass through untranslated.
+    """
+    segments = []
+    for part in _BOUNDARY_RE.split(text):
+        if not part:
+            continue
+        if part.isspace() or len(part) <= max_segment_chars:
+            segments.append(part)
+        else:
+            segments.extend(_split_long_segment(part, max_segment_chars))
+    return segments
+
+
+def _split_long_segment(segment, limit):
+    """Cut an over-long sentence at whitespace so no piece exceeds the limit."""
+    while len(segment) > limit:
+        cut = max(segment.rfind(' ', 0, limit), segment.rfind('\n', 0, limit)) + 1
+        if cut <= 0:
+            cut = limit  # No whitespace at all, fall back to a hard cut
+        yield segment[:cut]
+        segment = segment[cut:]
+    if segment:
+        yield segment
+
+
+def pack_batches(items, max_elements=MAX_ELEMENTS_PER_REQUEST, max_chars=MAX_CHARS_PER_REQUEST):
+    """Group (index, text) pairs into request bodies that stay within the per-request limits."""
+    batches = []
+    current = []
+    current_chars = 0
+    for index, text in items:
+        if current and (len(current) >= max_elements or current_chars + len(text) > max_chars):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append((index, text))
+        current_chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _restore_whitespace(original, translated):
+    """Re-apply the leading and trailing whitespace of the source segment to its translation."""
+    stripped = original.strip()
+    start = original.find(stripped)
+    return original[:start] + translated + original[start + len(stripped):]
+
+
+def detect_batch(texts, max_chars=DETECT_BATCH_CHARS):
+    """The leading texts, up to max_chars (at least one), to send before the source language is known."""
+    batch = []
+    size = 0
+    for text in texts:
+        if batch and size + len(text) > max_chars:
+            break
+        batch.append(text)
+        size += len(text)
+    return batch
+
+
+def target_chunks(target_languages):
+    """Split target languages into groups that fit one request even with a full-length segment."""
+    return [target_languages[i:i + MAX_TARGETS_PER_REQUEST]
+            for i in range(0, len(target_languages), MAX_TARGETS_PER_REQUEST)]
+
+
+def pack_requests(texts, translated, target_languages):
+    """(target languages, batch) request bodies for the texts still missing a translation.
+
+    A text is only sent to the targets it is missing (translated maps each target to {text:
+    translation}), and texts missing the same targets share requests. Azure counts every target
+    against the per-request character limit, so batches shrink as the number of targets grows.
+    """
+    missing = {}
+    for text in texts:
+        languages = tuple(language for language in target_languages if text not in translated[language])
+        if languages:
+            missing.setdefault(languages, []).append(text)
+    requests = []
+    for languages, group in missing.items():
+        for chunk in target_chunks(list(languages)):
+            requests.extend((chunk, batch) for batch in pack_batches(enumerate(group),
+                                                                     max_chars=MAX_CHARS_PER_REQUEST // len(chunk)))
+    return requests
+
+
+def read_translations(languages, batch, items, translated):
+    """Add a /translate response for batch to translated; returns the new {language: {text: translation}}."""
+    fresh = {language: {} for language in languages}
+    for (_, text), item in zip(batch, items):
+        # Translations come back in the order of the 'to' parameters
+        for language, translation in zip(languages, item['translations']):
+            fresh[language][text] = translation['text']
+    for language, translations in fresh.items():
+        translated[language].update(translations)
+    return fresh
+
+
+def translate_segments(segments, target_language, client, source_language=None,
+                       max_in_flight=MAX_IN_FLIGHT, memory=None):
+    """Translate segments in packed batches with bounded concurrency, preserving their order.
+
+    Returns (translated segments, source language); see translate_segments_multi.
+    """
+    translated, source_language = translate_segments_multi(segments, [target_language], client, source_language,
+                                                           max_in_flight=max_in_flight, memory=memory)
+    return translated[target_language], source_language
+
+
+def translate_segments_multi(segments, target_languages, client, source_language=None,
+                             max_in_flight=MAX_IN_FLIGHT, memory=None):
+    """Translate segments into every target language at once, preserving their order.
+
+    Each request carries all the targets (up to MAX_TARGETS_PER_REQUEST), so a segment is sent
+    once however many languages are wanted. Repeated segments are sent once. When the source
+    language is unknown, a small first batch (DETECT_BATCH_CHARS) is sent without 'from' and the
+    language Azure detects for it is used for the remaining batches, which are then sent
+    concurrently; this saves the separate /detect round trip. When a
+    translation memory is given, translations found in it are filled in locally and only the
+    missing (segment, target) pairs go to Azure.
+
+    Returns ({target language: translated segments}, source language).
+    """
+    pending = [(index, segment.strip()) for index, segment in enumerate(segments) if segment.strip()]
+    texts = list(dict.fromkeys(text for _, text in pending))
+    translated = {language: {} for language in target_languages}
+
+    if not source_language and texts:
+        languages, batch = pack_requests(detect_batch(texts), translated, target_languages)[0]
+        items = client.translate([text for _, text in batch], languages)
+        source_language = items[0]['detectedLanguage']['language']
+        logger.info(f"Detected language from first batch: {source_language}")
+        fresh = read_translations(languages, batch, items, translated)
+        if memory is not None:
+            for language, translations in fresh.items():
+                memory.put_many(source_language, language, translations.items())
+
+    cached = 0
+    if memory is not None and source_language:
+        for language in target_languages:
+            hits = memory.get_many(source_language, language,
+                                   {text for text in texts if text not in translated[language]})
+            translated[language].update(hits)
+            cached += len(hits)
+    requests = pack_requests(texts, translated, target_languages)
+
+    def send(languages, batch):
+        return client.translate([text for _, text in batch], languages, source_language)
+
+    logger.info(f"Translating {len(texts)} segments into {len(target_languages)} languages in {len(requests)} "
+                f"requests ({cached} from translation memory).")
+    metrics.count('segments_translated', len(pending) * len(target_languages))
+    metrics.count('translation_memory_hits', cached)
+    metrics.count('translation_batches', len(requests))
+    if requests:
+        if len(requests) == 1:
+            responses = [send(*requests[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_in_flight, len(requests)))) as executor:
+                # Copied contexts keep the caller's quota priority on the worker threads
+                responses = [future.result() for future in
+                             [executor.submit(contextvars.copy_context().run, send, *request) for request in requests]]
+        fresh = {language: {} for language in target_languages}
+        for (languages, batch), items in zip(requests, responses):
+            for language, translations in read_translations(languages, batch, items, translated).items():
+                fresh[language].update(translations)
+        if memory is not None:
+            for language, translations in fresh.items():
+                if translations:
+                    memory.put_many(source_language, language, translations.items())
+
+    results = {}
+    for language in target_languages:
+        results[language] = list(segments)
+        for index, text in pending:
+            results[language][index] = _restore_whitespace(segments[index], translated[language][text])
+    return results, source_language
+
+
+def translate_blocks(blocks, target_language, client, source_language=None,
+                     max_in_flight=MAX_IN_FLIGHT, memory=None):
+    """Translate independent text blocks (paragraphs, table cells, PDF text blocks) in shared batches.
+
+    Each distinct block is translated once however often it occurs. Returns
+    ({block: translated block}, source language).
+    """
+    translated, source_language = translate_blocks_multi(blocks, [target_language], client, source_language,
+                                                         max_in_flight=max_in_flight, memory=memory)
+    return translated[target_language], source_language
+
+
+def translate_blocks_multi(blocks, target_languages, client, source_language=None,
+                           max_in_flight=MAX_IN_FLIGHT, memory=None):
+    """translate_blocks into several languages at once; returns ({language: {block: translated block}}, source language)."""
+    unique = list(dict.fromkeys(block for block in blocks if block.strip()))
+    segments = []
+    bounds = []
+    for block in unique:
+        start = len(segments)
+        segments.extend(split_segments(block))
+        bounds.append((start, len(segments)))
+    translated, source_language = translate_segments_multi(segments, target_languages, client, source_language,
+                                                           max_in_flight=max_in_flight, memory=memory)
+    return {language: {block: ''.join(translated[language][start:stop]) for block, (start, stop) in zip(unique, bounds)}
+            for language in target_languages}, source_language
+
+
+def iter_translations(pieces, target_language, client, source_language=None,
+                      max_in_flight=MAX_IN_FLIGHT, memory=None, group_chars=MAX_CHARS_PER_REQUEST,
+                      first_group_chars=None):
+    """Translate an iterable of text pieces (e.g. PDF pages) while it is still being produced.
+
+    Yields (source text, translated text, source language) per group, in document order; see
+    iter_translations_multi.
+    """
+    for source_part, translations, language in iter_translations_multi(
+            pieces, [target_language], client, source_language, max_in_flight=max_in_flight, memory=memory,
+            group_chars=group_chars, first_group_chars=first_group_chars):
+        yield source_part, translations[target_language], language
+
+
+def iter_translations_multi(pieces, target_languages, client, source_language=None,
+                            max_in_flight=MAX_IN_FLIGHT, memory=None, group_chars=MAX_CHARS_PER_REQUEST,
+                            first_group_chars=None):
+    """Translate an iterable of text pieces into every target language while it is still being produced.
+
+    Segments are grouped into roughly one request body each, and every group is sent as soon as
+    it is full, so translation overlaps with whatever produces the pieces. With first_group_chars
+    the first group is kept that small and each later one doubles up to group_chars, so the first
+    result comes back quickly without splitting the rest into many small requests. When the source
+    language is unknown, the first group is at most DETECT_BATCH_CHARS, since the others wait for
+    the language it detects. Yields
+    (source text, {target language: translated text}, source language) per group, in document order.
+    """
+    def translate_group(group):
+        translated, language = translate_segments_multi(group, target_languages, client, source_language,
+                                                        max_in_flight=1, memory=memory)
+        return ''.join(group), {target: ''.join(parts) for target, parts in translated.items()}, language
+
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        def submit(group):
+            nonlocal source_language
+            if not source_language:
+                # The first group tells us the source language for all the others.
+                result = translate_group(group)
+                source_language = result[2]
+                return [result]
+            in_flight.append(executor.submit(contextvars.copy_context().run, translate_group, group))
+            ready = []
+            while in_flight and (in_flight[0].done() or len(in_flight) >= max_in_flight):
+                ready.append(in_flight.popleft().result())
+            return ready
+
+        group = []
+        group_size = 0
+        limit = min(first_group_chars or group_chars, group_chars)
+        if not source_language:
+            limit = min(limit, DETECT_BATCH_CHARS)
+        for piece in pieces:
+            for segment in split_segments(piece):
+                if group and group_size + len(segment) > limit:
+                    yield from submit(group)
+                    group = []
+                    group_size = 0
+                    limit = min(limit * 2, group_chars)
+                group.append(segment)
+                group_size += len(segment)
+        if group:
+            yield from submit(group)
+        while in_flight:
+            yield in_flight.popleft().result()
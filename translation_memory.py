@@ -0,0 +1,260 @@
+"""Segment-level translation memory: an in-process LRU in front of a local SQLite store.
+
+Entries are keyed by (source language, target language, SHA-256 of the segment text), so the
+same boilerplate is only ever sent to Azure (and billed) once per language pair.
+
+Invalidating bumps a generation counter stored next to the segments. Every process checks it
+on lookup and drops LRU entries cached under an older generation, so running workers stop
+serving invalidated translations without a restart.
+
+    python -m translation_memory stats
+    python -m translation_memory invalidate en fr
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.environ.get('TRANSLATION_MEMORY_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translation_memory.sqlite3'))
+DEFAULT_MAX_MEMORY_ENTRIES = int(os.environ.get('TRANSLATION_MEMORY_MAX_MEMORY_ENTRIES', 20000))
+DEFAULT_MAX_DISK_ENTRIES = int(os.environ.get('TRANSLATION_MEMORY_MAX_DISK_ENTRIES', 1000000))
+DETECTION_CACHE_SIZE = int(os.environ.get('DETECTION_CACHE_SIZE', 1024))
+# Same sample length the app used to send to /detect.
+DETECTION_PREFIX_CHARS = 100
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    """Two-level (LRU + SQLite) cache of segment translations with size-bounded eviction."""
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, max_memory_entries=DEFAULT_MAX_MEMORY_ENTRIES,
+                 max_disk_entries=DEFAULT_MAX_DISK_ENTRIES):
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'writes': 0, 'evictions': 0}
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        # WAL lets every gunicorn worker read while one of them writes.
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS segments (
+                source_language TEXT NOT NULL,
+                target_language TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                translation TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (source_language, target_language, text_hash)
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS segments_last_used ON segments (last_used)')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS generation (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                value INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute('INSERT OR IGNORE INTO generation VALUES (1, 0)')
+        self._conn.commit()
+        self._generation = self._read_generation()
+        # Upper bound on the row count, so writes only pay for COUNT(*) once eviction may be due.
+        self._disk_estimate = self._conn.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+
+    def get_many(self, source_language, target_language, texts):
+        """Return {text: translation} for every text found in the memory."""
+        found = {}
+        missing = {}
+        with self._lock:
+            if self._lru:
+                # Another process may have invalidated entries this one still holds
+                self._generation = self._read_generation()
+            for text in texts:
+                key = (source_language, target_language, text_hash(text))
+                entry = self._lru.get(key)
+                if entry is not None and entry[1] == self._generation:
+                    self._lru.move_to_end(key)
+                    found[text] = entry[0]
+                    self._counters['memory_hits'] += 1
+                else:
+                    if entry is not None:
+                        del self._lru[key]
+                    missing[key[2]] = text
+
+            if missing:
+                hashes = list(missing)
+                rows = []
+                # Stay under SQLite's bound-parameter limit.
+                for i in range(0, len(hashes), 500):
+                    chunk = hashes[i:i+500]
+                    rows.extend(self._conn.execute(
+                        f"SELECT text_hash, translation FROM segments WHERE source_language = ? AND target_language = ? "
+                        f"AND text_hash IN ({','.join('?' * len(chunk))})",
+                        [source_language, target_language, *chunk]).fetchall())
+                now = time.time()
+                for digest, translation in rows:
+                    found[missing[digest]] = translation
+                    self._remember((source_language, target_language, digest), translation)
+                self._counters['disk_hits'] += len(rows)
+                self._counters['misses'] += len(missing) - len(rows)
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE segments SET last_used = ? WHERE source_language = ? AND target_language = ? AND text_hash = ?",
+                        [(now, source_language, target_language, digest) for digest, _ in rows])
+                    self._conn.commit()
+        return found
+
+    def put_many(self, source_language, target_language, pairs):
+        """Store (text, translation) pairs for a language pair."""
+        pairs = list(pairs)
+        if not pairs:
+            return
+        now = time.time()
+        rows = [(source_language, target_language, text_hash(text), translation, now) for text, translation in pairs]
+        with self._lock:
+            for row in rows:
+                self._remember(row[:3], row[3])
+            self._conn.executemany("INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?)", rows)
+            self._counters['writes'] += len(rows)
+            self._evict_disk(len(rows))
+            self._conn.commit()
+
+    def invalidate(self, source_language=None, target_language=None):
+        """Drop entries for a language pair; either side may be None to match any language."""
+        clauses, params = [], []
+        if source_language:
+            clauses.append('source_language = ?')
+            params.append(source_language)
+        if target_language:
+            clauses.append('target_language = ?')
+            params.append(target_language)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self._lock:
+            for key in [k for k in self._lru
+                        if source_language in (None, k[0]) and target_language in (None, k[1])]:
+                del self._lru[key]
+            removed = self._conn.execute(f"DELETE FROM segments {where}", params).rowcount
+            self._conn.execute('UPDATE generation SET value = value + 1 WHERE id = 1')
+            self._conn.commit()
+            self._generation = self._read_generation()
+            self._disk_estimate = max(self._disk_estimate - removed, 0)
+        logger.info(f"Invalidated {removed} translation memory entries ({source_language or '*'} -> {target_language or '*'}).")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_entries'] = len(self._lru)
+            stats['disk_entries'] = self._conn.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _read_generation(self):
+        return self._conn.execute('SELECT value FROM generation WHERE id = 1').fetchone()[0]
+
+    def _remember(self, key, translation):
+        self._lru[key] = (translation, self._generation)
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_memory_entries:
+            self._lru.popitem(last=False)
+
+    def _evict_disk(self, added):
+        self._disk_estimate += added
+        if self._disk_estimate <= self.max_disk_entries:
+            return
+        count = self._conn.execute('SELECT COUNT(*) FROM segments').fetchone()[0]
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM segments WHERE rowid IN (SELECT rowid FROM segments ORDER BY last_used LIMIT ?)", (excess,))
+            self._counters['evictions'] += excess
+        self._disk_estimate = count - max(excess, 0)
+
+
+class DetectionCache:
+    """Small in-process LRU of detected source languages, keyed by a hash of the text prefix."""
+
+    def __init__(self, max_entries=DETECTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0}
+
+    def get(self, text):
+        key = text_hash(text[:DETECTION_PREFIX_CHARS])
+        with self._lock:
+            language = self._entries.get(key)
+            if language is None:
+                self._counters['misses'] += 1
+            else:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+            return language
+
+    def put(self, text, language):
+        if self.max_entries <= 0:
+            return
+        key = text_hash(text[:DETECTION_PREFIX_CHARS])
+        with self._lock:
+            self._entries[key] = language
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries))
+
+
+_memory = None
+_memory_lock = threading.Lock()
+detection_cache = DetectionCache()
+
+
+def get_translation_memory():
+    """Return the process-wide translation memory, opening it on first use."""
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = TranslationMemory()
+        return _memory
+
+
+def stats():
+    """The translation memory's counters, or {} if this process has not opened it yet."""
+    memory = _memory
+    return memory.stats() if memory is not None else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or invalidate the local translation memory.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Print hit/miss counters and entry counts")
+    invalidate = subparsers.add_parser('invalidate', help="Drop entries for a language pair")
+    invalidate.add_argument('source_language', help="Source language code, or '*' for any")
+    invalidate.add_argument('target_language', help="Target language code, or '*' for any")
+    args = parser.parse_args()
+
+    memory = get_translation_memory()
+    if args.command == 'stats':
+        print(json.dumps(memory.stats(), indent=2))
+    else:
+        source = None if args.source_language == '*' else args.source_language
+        target = None if args.target_language == '*' else args.target_language
+        print(f"Removed {memory.invalidate(source, target)} entries.")
+
+
+if __name__ == '__main__':
+    main()
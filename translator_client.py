@@ -0,0 +1,183 @@
+"""Shared, pooled HTTP client for the Azure Translator REST API.
+
+One client per process is shared by the Flask app and the Excel batch scripts, so TCP/TLS
+connections are reused across requests. Throttling (429) and server errors (5xx) are retried
+with jittered exponential backoff, honouring the service's Retry-After header. Every request
+first takes its characters from the key's shared quota (see rate_limiter).
+"""
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+API_VERSION = '3.0'
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Sized for one in-flight document per gunicorn thread, each fanning out to TRANSLATION_MAX_IN_FLIGHT requests.
+DEFAULT_POOL_SIZE = int(os.environ.get('TRANSLATOR_POOL_SIZE', 16))
+DEFAULT_MAX_RETRIES = int(os.environ.get('TRANSLATOR_MAX_RETRIES', 4))
+DEFAULT_CONNECT_TIMEOUT = float(os.environ.get('TRANSLATOR_CONNECT_TIMEOUT', 5))
+DEFAULT_READ_TIMEOUT = float(os.environ.get('TRANSLATOR_READ_TIMEOUT', 60))
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30
+
+
+class TranslatorError(Exception):
+    """Raised when the Translator service keeps failing after all retries."""
+
+
+class TranslatorClient:
+    """Thread-safe Translator client with a bounded connection pool, retries and timeouts."""
+
+    def __init__(self, key, endpoint, location, pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES,
+                 connect_timeout=DEFAULT_CONNECT_TIMEOUT, read_timeout=DEFAULT_READ_TIMEOUT, verify=False,
+                 quota=None):
+        self.endpoint = endpoint.rstrip('/')
+        self.max_retries = max_retries
+        self.timeout = (connect_timeout, read_timeout)
+        self.quota = quota
+        self._headers = {
+            'Ocp-Apim-Subscription-Key': key,
+            'Ocp-Apim-Subscription-Region': location,
+            'Content-type': 'application/json',
+        }
+
+        # pool_block makes callers wait for a free connection instead of opening unbounded extras.
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.mount('https://', self._adapter)
+        self.session.mount('http://', self._adapter)
+
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'retries': 0, 'throttled': 0, 'server_errors': 0,
+                          'timeouts': 0, 'connection_errors': 0, 'failures': 0}
+
+    def translate(self, texts, to, source_language=None, **extra_params):
+        """POST /translate for a list of strings and return the raw response items."""
+        params = {'to': list(to), **extra_params}
+        if source_language:
+            params['from'] = source_language
+        # Azure bills every character once per target language.
+        return self.post('/translate', params, [{'text': text} for text in texts], "Error: Unable to translate text",
+                         chars=sum(map(len, texts)) * len(params['to']))
+
+    def detect(self, texts):
+        """POST /detect for a list of strings and return the raw response items."""
+        return self.post('/detect', {}, [{'text': text} for text in texts], "Error: Unable to detect language",
+                         chars=sum(map(len, texts)))
+
+    def post(self, path, params, body, error_message="Error: Translator request failed", chars=0):
+        url = self.endpoint + path
+        params = {'api-version': API_VERSION, **params}
+        stage = f"translator{path.replace('/', '_')}"
+        waited = self.quota.acquire(chars) if self.quota is not None else 0
+        if waited:
+            metrics.observe('quota_wait', waited)
+        metrics.count('translator_chars', chars, path=path)
+        for attempt in range(self.max_retries + 1):
+            headers = dict(self._headers, **{'X-ClientTraceId': str(uuid.uuid4())})
+            retry_after = None
+            self._count('requests')
+            try:
+                with metrics.span(stage):
+                    response = self.session.post(url, params=params, headers=headers, json=body, timeout=self.timeout)
+            except requests.Timeout as e:
+                self._count('timeouts')
+                reason = f"timeout: {e}"
+            except requests.ConnectionError as e:
+                self._count('connection_errors')
+                reason = f"connection error: {e}"
+            else:
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code not in RETRY_STATUSES:
+                    self._count('failures')
+                    logger.error(f"Translator API error on {path}: {response.status_code} {response.text}")
+                    raise TranslatorError(error_message)
+                self._count('throttled' if response.status_code == 429 else 'server_errors')
+                retry_after = response.headers.get('Retry-After')
+                reason = f"HTTP {response.status_code}"
+
+            if attempt == self.max_retries:
+                break
+            delay = self._backoff_delay(attempt, retry_after)
+            if retry_after and self.quota is not None:
+                # Our bucket was optimistic (or another host shares the key): hold back every caller.
+                self.quota.pause(delay)
+            self._count('retries')
+            logger.warning(f"Translator {path} failed ({reason}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s.")
+            time.sleep(delay)
+
+        self._count('failures')
+        logger.error(f"Translator API error on {path}: giving up after {self.max_retries + 1} attempts ({reason}).")
+        raise TranslatorError(error_message)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        pools = []
+        pool_manager = self._adapter.poolmanager
+        for key in pool_manager.pools.keys():
+            pool = pool_manager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                'host': pool.host,
+                'max_size': pool.pool.maxsize if pool.pool else 0,
+                'free_slots': pool.pool.qsize() if pool.pool else 0,
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+            })
+        stats['pools'] = pools
+        return stats
+
+    @staticmethod
+    def _backoff_delay(attempt, retry_after):
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after) + random.uniform(0, BACKOFF_BASE_SECONDS))
+            except ValueError:
+                pass  # HTTP-date form; fall back to our own backoff
+        return delay
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_translator_client():
+    """Return the process-wide Translator client, configured from the environment on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TranslatorClient(
+                key=os.environ.get("AZURE_TRANSLATION_KEY"),
+                endpoint=os.environ.get("AZURE_TRANSLATION_ENDPOINT"),
+                location=os.environ.get("AZURE_TRANSLATION_LOCATION"),
+                verify=os.environ.get('TRANSLATOR_VERIFY_SSL', 'false').lower() == 'true',
+                quota=rate_limiter.get_translator_quota(),
+            )
+        return _client
+
+
+def stats():
+    """The Translator client's counters, or {} if this process has not created it yet."""
+    client = _client
+    return client.stats() if client is not None else {}
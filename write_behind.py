@@ -0,0 +1,214 @@
+"""Write-behind persistence: request handlers enqueue rows and a background thread inserts them.
+
+Rows are written in batches with executemany. If the database is unavailable, the batch is
+appended to a local JSON-lines journal instead. Journaled rows are retried periodically and
+picked up by the next process to start, so nothing is lost across restarts.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', 50))
+FLUSH_INTERVAL_SECONDS = float(os.environ.get('WRITE_BEHIND_FLUSH_INTERVAL', 1.0))
+MAX_QUEUE_SIZE = int(os.environ.get('WRITE_BEHIND_MAX_QUEUE', 10000))
+FAST_EXECUTEMANY = os.environ.get('WRITE_BEHIND_FAST_EXECUTEMANY', 'true').lower() == 'true'
+# How long to wait before retrying the journal after a failed write.
+RETRY_INTERVAL_SECONDS = float(os.environ.get('WRITE_BEHIND_RETRY_INTERVAL', 30))
+
+
+class WriteBehindQueue:
+    """Batches rows for one INSERT statement onto a background writer thread.
+
+    With statements, a batch of queued rows is instead turned into several (insert query, rows,
+    input sizes) statements that are written in one transaction, e.g. parent and child rows.
+    """
+
+    def __init__(self, name, insert_query, connection_factory, journal_dir, input_sizes=None,
+                 batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL_SECONDS, max_queue_size=MAX_QUEUE_SIZE,
+                 statements=None):
+        self.name = name
+        self.insert_query = insert_query
+        self.connection_factory = connection_factory
+        self.input_sizes = input_sizes
+        self.statements = statements
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal_dir = journal_dir
+        self.journal_path = os.path.join(journal_dir, f"{name}-{os.getpid()}.jsonl")
+        os.makedirs(journal_dir, exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._journal_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._retry_at = 0.0
+        self._counters = {'enqueued': 0, 'rows_written': 0, 'batches_written': 0, 'rows_journaled': 0,
+                          'rows_replayed': 0, 'write_failures': 0, 'last_batch_size': 0,
+                          'last_flush_seconds': 0.0, 'max_flush_seconds': 0.0, 'total_flush_seconds': 0.0}
+
+    def start(self):
+        """Start the writer thread; journals left behind by earlier processes are replayed first."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def enqueue(self, row):
+        """Queue a row (a tuple of INSERT parameters) without waiting for the database."""
+        self.start()
+        with self._stats_lock:
+            self._counters['enqueued'] += 1
+        try:
+            self._queue.put_nowait(tuple(row))
+        except queue.Full:
+            logger.warning(f"Write-behind queue '{self.name}' is full; journaling row.")
+            self._journal([tuple(row)])
+
+    def stop(self, timeout=10):
+        """Flush what is queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._counters)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['avg_batch_size'] = stats['rows_written'] / stats['batches_written'] if stats['batches_written'] else 0.0
+        stats['avg_flush_seconds'] = (stats['total_flush_seconds'] / stats['batches_written']
+                                      if stats['batches_written'] else 0.0)
+        return stats
+
+    def _run(self):
+        self._replay_journals(claim_all=True)
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            if self._retry_at and time.monotonic() >= self._retry_at:
+                self._replay_journals()
+
+    def _next_batch(self):
+        """Collect up to batch_size rows, waiting at most flush_interval after the first one."""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows):
+        start = time.perf_counter()
+        statements = self.statements(rows) if self.statements else [(self.insert_query, rows, self.input_sizes)]
+        with self.connection_factory() as conn:
+            cursor = conn.cursor()
+            fast = FAST_EXECUTEMANY and hasattr(cursor, 'fast_executemany')
+            if fast:
+                cursor.fast_executemany = True
+            for insert_query, statement_rows, input_sizes in statements:
+                if fast and input_sizes:
+                    # NVARCHAR(MAX) columns need explicit sizes or fast_executemany truncates them.
+                    cursor.setinputsizes(input_sizes)
+                cursor.executemany(insert_query, statement_rows)
+            conn.commit()
+            cursor.close()
+        elapsed = time.perf_counter() - start
+        metrics.observe('db_write', elapsed)
+        metrics.count('db_rows_written', len(rows), table=self.name)
+        with self._stats_lock:
+            self._counters['rows_written'] += len(rows)
+            self._counters['batches_written'] += 1
+            self._counters['last_batch_size'] = len(rows)
+            self._counters['last_flush_seconds'] = elapsed
+            self._counters['max_flush_seconds'] = max(self._counters['max_flush_seconds'], elapsed)
+            self._counters['total_flush_seconds'] += elapsed
+
+    def _flush(self, rows):
+        try:
+            self._write(rows)
+        except Exception as e:
+            logger.error(f"Write-behind flush of {len(rows)} rows to '{self.name}' failed; journaling: {e}")
+            with self._stats_lock:
+                self._counters['write_failures'] += 1
+            self._journal(rows)
+            self._retry_at = time.monotonic() + RETRY_INTERVAL_SECONDS
+
+    def _journal(self, rows):
+        with self._journal_lock:
+            with open(self.journal_path, 'a', encoding='utf-8') as journal:
+                for row in rows:
+                    journal.write(json.dumps(row) + '\n')
+                journal.flush()
+                os.fsync(journal.fileno())
+        with self._stats_lock:
+            self._counters['rows_journaled'] += len(rows)
+        if not self._retry_at:
+            self._retry_at = time.monotonic() + RETRY_INTERVAL_SECONDS
+
+    def _replay_journals(self, claim_all=False):
+        """Insert journaled rows. At startup, journals of dead processes are claimed as well."""
+        self._retry_at = 0.0
+        paths = [self.journal_path]
+        if claim_all:
+            # Journals (and half-finished replays) whose owning process has exited.
+            for path in glob.glob(os.path.join(self.journal_dir, f"{self.name}-*")):
+                pid = int(path.rsplit('-', 1)[1].split('.')[0])
+                if pid != os.getpid() and not _pid_alive(pid):
+                    paths.append(path)
+        for path in paths:
+            claimed = f"{path.split('.replay-')[0]}.replay-{os.getpid()}"
+            with self._journal_lock:
+                try:
+                    # Renaming is atomic, so two workers starting together never replay the same file.
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue
+            with open(claimed, encoding='utf-8') as journal:
+                rows = [tuple(json.loads(line)) for line in journal if line.strip()]
+            try:
+                for i in range(0, len(rows), self.batch_size):
+                    self._write(rows[i:i + self.batch_size])
+            except Exception as e:
+                logger.error(f"Replaying journal {claimed} failed; will retry: {e}")
+                self._journal(rows[i:])
+                os.remove(claimed)
+                self._retry_at = time.monotonic() + RETRY_INTERVAL_SECONDS
+                return
+            os.remove(claimed)
+            with self._stats_lock:
+                self._counters['rows_replayed'] += len(rows)
+            logger.info(f"Replayed {len(rows)} journaled rows into '{self.name}'.")
+
+
+def _pid_alive(pid):
+    """True if a process with this id exists, i.e. its half-replayed journal is not abandoned."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True